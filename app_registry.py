@@ -0,0 +1,46 @@
+"""
+app registry
+
+The one table of apps, the buttons that select them and the status each
+app is started with. Used by the launcher and when a button wakes us.
+Apps are only imported when they are run.
+
+Use:
+import app_registry
+"""
+
+# button, app, launcher label, launcher pen, status, status on the wake that switches to the app
+# When switching from another app the switch status is used once, then status.
+APPS = (
+    ('a', 'image_gallery', "<< Photo", 4, '<<', None),
+    ('b', 'image_gallery', "Photo >>", 6, '>>', None),
+    ('c', 'nasa_apod', "NASA Picture of the Day", 2, '>>', None),
+    ('d', 'xkcd_daily', "XKCD Daily", 3, '>>', None),
+    ('e', 'rtc_clock', "RTC Clock", 0, 'wait', 'sync'),
+)
+
+
+def find(button):
+    for entry in APPS:
+        if entry[0] == button:
+            return entry
+    return None
+
+
+def select(button, current_app):
+    # Returns (app, status, status_change) for a button press
+    button, app, label, pen, status, switch_status = find(button)
+    if app == current_app:
+        return app, status, None
+    return app, switch_status, status
+
+
+def launcher_menu():
+    # (button, label, pen, app) for each launcher row
+    return tuple((button, f'{button.upper()}. {label}', pen, app)
+                 for button, app, label, pen, status, switch_status in APPS)
+
+
+def load(app_name):
+    # Imports only the app that is going to run
+    return __import__(f'apps/{app_name}')
@@ -1,6 +1,9 @@
 import jpegdec
 import os
 import gc
+import random
+import struct
+import time
 import inky_frame
 import inky_helper as ih
 from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7 as DISPLAY  # 7.3"
@@ -10,7 +13,8 @@ image gallery
 
 An offline image gallery that displays jpg images from an SD card.
 Copy images to the /photos directory of your SD card by plugging it into a computer.
-Images must be 800x480px or smaller and saved as *non-progressive* jpgs.
+Larger images are scaled down by 2, 4 or 8 to fit and centred.
+Images must be saved as *non-progressive* jpgs, progressive ones are skipped.
 
 """
 
@@ -21,23 +25,80 @@ status = None
 # Length of time between updates in minutes.
 # Frequent updates will reduce battery life!
 UPDATE_INTERVAL = 15
+# Offline, the radio stays off
+NEEDS_NETWORK = False
 # Image location
 IMGDIR = '/sd/photos'
 
-# Image files
-images = None
+# The photos are listed in a manifest beside IMGDIR, so a wake reads one
+# record instead of the whole directory. photos.idx holds a header and one
+# fixed-width record per file, photos.names the file names back to back.
+# It is rebuilt when it is missing, older than MANIFEST_MAX_AGE, a photo
+# in it can't be opened, or IMGDIR's mtime differs from when it was built.
+# FAT doesn't always update a directory's mtime, so after the refresh
+# the entries in IMGDIR are also counted against the header. A stale
+# manifest is still used for this wake and rebuilt after the refresh. A rebuild keeps the records of files that are still there.
+# Each photo's JPEG header is probed the first time it comes up and the
+# result is written back into its record.
+MANIFEST = f'{IMGDIR}.idx'
+MANIFEST_NAMES = f'{IMGDIR}.names'
+MANIFEST_MAGIC = b'IFPM'
+MANIFEST_VERSION = 4
+# magic, version, number of records, time built, IMGDIR entries and mtime
+MANIFEST_HEADER = '<4sHIiIi'
+# name offset, name length, flags, file size, width, height
+MANIFEST_RECORD = '<IHBIHH'
+MANIFEST_MAX_AGE = 86400
+# How far ahead a rebuild looks for a file in the old manifest
+MANIFEST_LOOKAHEAD = 16
+# Leave identical photos out of the manifest, all but the first by name.
+# A rebuild then also stats every photo and holds an entry per photo in
+# RAM, see ih.find_duplicates().
+SKIP_DUPLICATES = False
+
+# Record flags
+PHOTO_JPEG = 0x01
+PHOTO_PROBED = 0x02
+# Probed, and a baseline JPEG that jpegdec can decode
+PHOTO_BASELINE = 0x04
+
+# jpegdec scale for each divisor
+JPEG_SCALES = {
+    1: jpegdec.JPEG_SCALE_FULL,
+    2: jpegdec.JPEG_SCALE_HALF,
+    4: jpegdec.JPEG_SCALE_QUARTER,
+    8: jpegdec.JPEG_SCALE_EIGHTH,
+}
+
+# Shuffle visits every photo once per cycle, in an order picked by a
+# random key. '>>' and '<<' step forwards and backwards through it. Only
+# the key and the position in the cycle are kept in state.json, the
+# photo at a position comes from a Feistel network over the indices.
+SHUFFLE = False
+SHUFFLE_ROUNDS = 4
+
+# Number of files in the manifest
+count = 0
+# The manifest is rebuilt in the background this wake
+manifest_stale = False
+# Entries in IMGDIR when the manifest was built
+manifest_entries = None
 # Image/photo index
 index = None
+# File name at the index
+image = None
+# (x, y, divisor) of the photo on the display
+layout = None
 
 def decrement_index(index):
     if index == 0:
-        index = len(images)-1
+        index = count-1
     else:
         index -= 1
     return index
 
 def increment_index(index):
-    if index == len(images)-1:
+    if index == count-1:
         index = 0
     else:
         index += 1
@@ -47,49 +108,319 @@ def update_index(index):
     global status
     if status:
         if status == '>>':
-            return increment_index(index)
+            return shuffle_step(1) if SHUFFLE else increment_index(index)
         elif status == '<<':
-            return decrement_index(index)
+            return shuffle_step(-1) if SHUFFLE else decrement_index(index)
         else:
             print(f'Error: Cycle status {status} is invalid. Assuming >>')
             status = '>>'
-            return increment_index(index)
+            return shuffle_step(1) if SHUFFLE else increment_index(index)
     return index
+
+# ----- Shuffle -----
+
+def feistel(value, key, round, mask):
+    # Round function, kept to small ints
+    value = (value ^ key ^ round * 0x2f5a3b) * 0x45d9f3b & 0x3fffffff
+    value = (value ^ value >> 15) * 0x2c1b3c6d & 0x3fffffff
+    return (value ^ value >> 13) & mask
+
+def permute(position, key, count):
+    # The photo index at a position in the shuffled cycle. The Feistel
+    # network is a bijection on [0, 4 ** bits), which is less than four
+    # times count, and walking the cycle until the value lands in
+    # [0, count) makes it one on [0, count).
+    bits = 1
+    while 1 << (2 * bits) < count:
+        bits += 1
+    mask = (1 << bits) - 1
+    value = position
+    while True:
+        left, right = value >> bits, value & mask
+        for round in range(SHUFFLE_ROUNDS):
+            left, right = right, left ^ feistel(right, key, round, mask)
+        value = left << bits | right
+        if value < count:
+            return value
+
+def shuffle_step(step):
+    # Moves through the shuffled cycle and returns the photo index.
+    # A new cycle, or a change in the number of photos, picks a new key.
+    shuffle = ih.get_shuffle()
+    if type(shuffle) is not list or len(shuffle) != 3 or shuffle[2] != count:
+        shuffle = [random.getrandbits(30), -1, count]
+    key, position = shuffle[0], shuffle[1] + step
+    if position >= count:
+        key, position = random.getrandbits(30), 0
+    elif position < 0:
+        position = count - 1
+    ih.update_shuffle([key, position, count])
+    return permute(position, key, count)
     
 def is_jpg(filename):
-    if '.jpg' in filename or '.jpeg' in filename:
-        return True
-    elif '.JPG' in filename or '.JPEG' in filename:
-        return True
+    filename = filename.lower()
+    return filename.endswith('.jpg') or filename.endswith('.jpeg')
+
+def get_flags(filename, size):
+    flags = 0
+    if is_jpg(filename) and size > 0:
+        flags |= PHOTO_JPEG
+    return flags
+
+# ----- Manifest -----
+
+def read_header():
+    # (count, time built, entries, mtime), or None if there is no usable
+    # manifest
+    if not ih.file_exists(MANIFEST) or not ih.file_exists(MANIFEST_NAMES):
+        return None
+    header_size = struct.calcsize(MANIFEST_HEADER)
+    with open(MANIFEST, 'rb') as f:
+        data = f.read(header_size)
+    if len(data) < header_size:
+        return None
+    magic, version, count, built, entries, mtime = struct.unpack(MANIFEST_HEADER, data)
+    if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+        return None
+    return count, built, entries, mtime
+
+def count_entries():
+    # Streams IMGDIR without keeping it
+    entries = 0
+    for entry in os.ilistdir(IMGDIR):
+        entries += 1
+    return entries
+
+def read_record(index):
+    # (name, flags, size, width, height), with one seek into each file
+    record_size = struct.calcsize(MANIFEST_RECORD)
+    with open(MANIFEST, 'rb') as f:
+        f.seek(struct.calcsize(MANIFEST_HEADER) + index * record_size)
+        offset, length, flags, size, width, height = struct.unpack(MANIFEST_RECORD, f.read(record_size))
+    with open(MANIFEST_NAMES, 'rb') as f:
+        f.seek(offset)
+        name = f.read(length).decode()
+    return name, flags, size, width, height
+
+def update_record(index, flags, width, height):
+    # Writes the probe result into a record in place
+    record_size = struct.calcsize(MANIFEST_RECORD)
+    position = struct.calcsize(MANIFEST_HEADER) + index * record_size
+    with open(MANIFEST, 'r+b') as f:
+        f.seek(position)
+        offset, length, old_flags, size, old_width, old_height = struct.unpack(MANIFEST_RECORD, f.read(record_size))
+        f.seek(position)
+        f.write(struct.pack(MANIFEST_RECORD, offset, length, flags, size, width, height))
+
+def read_records():
+    # Yields (name, flags, size, width, height) for every record, in order
+    header = read_header()
+    if header is None:
+        return
+    record_size = struct.calcsize(MANIFEST_RECORD)
+    with open(MANIFEST, 'rb') as f, open(MANIFEST_NAMES, 'rb') as names:
+        f.seek(struct.calcsize(MANIFEST_HEADER))
+        for i in range(header[0]):
+            offset, length, flags, size, width, height = struct.unpack(MANIFEST_RECORD, f.read(record_size))
+            yield names.read(length).decode(), flags, size, width, height
+
+def find_record(old, ahead, name):
+    # The old record for name, looking up to MANIFEST_LOOKAHEAD records
+    # past the last match. Records skipped over were deleted.
+    while len(ahead) < MANIFEST_LOOKAHEAD:
+        try:
+            ahead.append(next(old))
+        except StopIteration:
+            break
+    for i, record in enumerate(ahead):
+        if record[0] == name:
+            del ahead[:i + 1]
+            return record
+    return None
+
+def build_manifest():
+    # Streams the directory into new manifest files, then renames them
+    # over the old ones. Returns the number of files.
+    global manifest_entries
+    print(f'Building manifest for {IMGDIR}')
+    old = read_records()
+    ahead = []
+    count = 0
+    reused = 0
+    offset = 0
+    skip = set()
+    if SKIP_DUPLICATES:
+        for same in ih.find_duplicates(IMGDIR).values():
+            skip.update(same[1:])
+    with open(f'{MANIFEST}.tmp', 'wb') as f, open(f'{MANIFEST_NAMES}.tmp', 'wb') as names:
+        f.write(struct.pack(MANIFEST_HEADER, MANIFEST_MAGIC, MANIFEST_VERSION, 0, 0, 0, 0))
+        entries = 0
+        for entry in os.ilistdir(IMGDIR):
+            entries += 1
+            name = entry[0]
+            if entry[1] & 0x4000 or name in skip:
+                continue
+            size = entry[3] if len(entry) > 3 else os.stat(f'{IMGDIR}/{name}')[6]
+            record = find_record(old, ahead, name)
+            if record is not None and record[2] == size:
+                flags, width, height = record[1], record[3], record[4]
+                reused += 1
+            else:
+                flags, width, height = get_flags(name, size), 0, 0
+            encoded = name.encode()
+            f.write(struct.pack(MANIFEST_RECORD, offset, len(encoded), flags, size, width, height))
+            names.write(encoded)
+            offset += len(encoded)
+            count += 1
+        f.seek(0)
+        f.write(struct.pack(MANIFEST_HEADER, MANIFEST_MAGIC, MANIFEST_VERSION, count, time.time(),
+                            entries, os.stat(IMGDIR)[8]))
+    old.close()
+    manifest_entries = entries
+    os.rename(f'{MANIFEST}.tmp', MANIFEST)
+    os.rename(f'{MANIFEST_NAMES}.tmp', MANIFEST_NAMES)
+    ih.forget(MANIFEST)
+    print(f'Manifest: {count} files, {reused} unchanged')
+    return count
+
+def load_manifest():
+    # Number of files. Without a manifest it is built now, a stale one is
+    # rebuilt after the refresh, see after_refresh().
+    global manifest_stale
+    global manifest_entries
+    header = read_header()
+    if header is None:
+        return build_manifest()
+    manifest_entries = header[2]
+    manifest_stale = time.time() - header[1] > MANIFEST_MAX_AGE or os.stat(IMGDIR)[8] != header[3]
+    return header[0]
+
+def check_manifest():
+    # Counting reads every directory entry, so it waits for the refresh
+    if count_entries() != manifest_entries:
+        print(f'{IMGDIR} changed')
+        build_manifest()
+
+# ----- JPEG -----
+
+def probe(index, filename, flags):
+    # Probes a photo once, keeping the result in its record.
+    # Returns (flags, width, height).
+    try:
+        info = ih.probe_jpeg(f'{IMGDIR}/{filename}')
+    except OSError as e:
+        print(f'Error: Unable to open {filename}. {e}')
+        return flags, 0, 0
+    width = height = 0
+    flags |= PHOTO_PROBED
+    if info is None:
+        print(f'Skipping {filename}, not a JPEG')
     else:
-        return False
+        width, height, baseline = info
+        if baseline:
+            flags |= PHOTO_BASELINE
+        else:
+            print(f'Skipping {filename}, progressive JPEG')
+    update_record(index, flags, width, height)
+    return flags, width, height
 
-def display_image(jdecoder, filename):
+def peek_index(index):
+    # The index the next wake will show if nothing changes, or None
+    if SHUFFLE and status:
+        shuffle = ih.get_shuffle()
+        position = shuffle[1] + (-1 if status == '<<' else 1)
+        if position < 0 or position >= count:
+            return None
+        return permute(position, shuffle[0], count)
+    return decrement_index(index) if status == '<<' else increment_index(index)
+
+def probe_ahead(index):
+    # Probes the next photo so the next wake doesn't have to
+    record = read_record(index)
+    if record[1] & PHOTO_JPEG and not record[1] & PHOTO_PROBED:
+        probe(index, record[0], record[1])
+
+def get_layout(width, height):
+    # (x, y, divisor) that fits the photo on the display and centres it.
+    # Anything more than 8 times too big is cropped.
+    for divisor in sorted(JPEG_SCALES):
+        if width // divisor <= WIDTH and height // divisor <= HEIGHT:
+            break
+    x = max(0, (WIDTH - width // divisor) // 2)
+    y = max(0, (HEIGHT - height // divisor) // 2)
+    return x, y, divisor
+
+def display_image(jdecoder, filename, layout):
     # Open the JPEG file
     jdecoder.open_file(f'{IMGDIR}/{filename}')
 
     # Decode the JPEG
-    jdecoder.decode(0, 0, jpegdec.JPEG_SCALE_FULL)
+    x, y, divisor = layout
+    jdecoder.decode(x, y, JPEG_SCALES[divisor])
     gc.collect()
 
 def update():
-    global images
+    global count
     global index
-    
-    images = os.listdir(IMGDIR)
-    
+    global image
+    global layout
+
+    count = load_manifest()
+    if count == 0:
+        print(f'Error: No photos in {IMGDIR}')
+        image = None
+        return
+
     index = ih.get_index()
+    if type(index) is not int or index >= count:
+        index = 0
     index = update_index(index)
-    while not is_jpg(images[index]):
-        index = update_index(index)
+    image, flags, size, width, height = read_record(index)
+    # Skip anything that isn't a photo jpegdec can decode, at most once round
+    for i in range(count):
+        if flags & PHOTO_JPEG and not flags & PHOTO_PROBED:
+            flags, width, height = probe(index, image, flags)
+        if flags & PHOTO_BASELINE:
+            break
+        index = update_index(index) if status else increment_index(index)
+        image, flags, size, width, height = read_record(index)
     ih.update_index(index)
+    if not flags & PHOTO_BASELINE:
+        print(f'Error: No photos in {IMGDIR} can be displayed')
+        image = None
+        return
+    layout = get_layout(width, height)
     print('Current photo index:', index)
 
 
+def after_refresh():
+    if image is None:
+        return
+    ahead = peek_index(index)
+    if ahead is not None and ahead != index:
+        probe_ahead(ahead)
+    # After the probe, which writes to the manifest in place
+    if manifest_stale:
+        build_manifest()
+    else:
+        check_manifest()
+
+
+def render_key():
+    return image
+
 def draw():
     # Create a new JPEG decoder for our PicoGraphics
     j = jpegdec.JPEG(graphics)
     gc.collect()
 
-    print(f'Displaying {images[index]}')
-    display_image(j, images[index])
\ No newline at end of file
+    if image is None:
+        return
+    print(f'Displaying {image}')
+    try:
+        display_image(j, image, layout)
+    except OSError as e:
+        print(f'Error: Unable to display {image}. {e}')
+        # The photo may have been removed, rebuild the manifest next wake
+        ih.remove_file(MANIFEST)
+        return
@@ -3,7 +3,6 @@ import gc
 import time
 import jpegdec
 import ujson
-from urllib import urequest
 from ucollections import OrderedDict
 import inky_helper as ih
 
@@ -16,107 +15,319 @@ status = None
 UPDATE_INTERVAL = 240
 
 FILENAME = 'nasa-apod'
-# Image location
+# Images are kept in the blob store under their file names. FILEDIR is
+# where they were saved before, it is imported once.
+STORE = 'nasa_apod'
 FILEDIR = '/sd/nasa_apod'
-# Log file to store NASA APOD dates and titles
-FILELOG = 'nasa-apod-log.json'
+# Log of the images kept and their titles, by date. Each line is a
+# JSON record: {"file": ..., "title": ...} adds an image, {"drop": ...}
+# removes one. It is only appended to, and rewritten with just the live
+# images when MAXFILES pruning runs.
+FILELOG = 'nasa-apod-log.jsonl'
+# The log before, a {file: title} dict rewritten every wake. Read once.
+OLD_FILELOG = 'nasa-apod-log.json'
 # Maximum number of files to keep
 MAXFILES = 10
+# Roughly when a new picture is published, seconds after midnight UTC
+PUBLISH_TIME = 5 * 3600
 
 # A Demo Key is used in this example and is IP rate limited. You can get your own API Key from https://api.nasa.gov/
 API_URL = 'https://api.nasa.gov/planetary/apod?api_key=DEMO_KEY'
 IMG_URL = 'https://pimoroni.github.io/feed2image/nasa-apod-800x480-daily.jpg'
+# Read from the API response as it streams in, the rest is skipped
+API_FIELDS = ('title', 'date', 'url', 'media_type')
 
-# Store NASA APOD titles {filename:title}
-apod_log = list()
+# After the frame has been offline, or on its first run, the days it
+# missed are fetched in one go: one API request for the date range, then
+# the images back to back over the same WiFi connection. Only days that
+# MAXFILES would keep are fetched, within a byte and time budget per
+# wake. The rest carry over to the next wake.
+BACKFILL = True
+BACKFILL_BYTES = 2 * 1024 * 1024
+BACKFILL_SECONDS = 120
+
+# File names in date order, so an index is a position in this list
+apod_files = list()
+# {file: title}, {title: file} and {file: position}
+apod_titles = dict()
+apod_by_title = dict()
+apod_positions = dict()
 # Image index
 index = None
 
+def get_filename(t=None):
+    # The image for the day of t, today by default
+    year, month, day, hour, minute, second, dow, _ = time.localtime() if t is None else time.localtime(t)
+    date = f'{month:02}.{day:02}.{year:04}'
+    return f'{FILENAME}_{date}.jpg'
+
+def get_api_date(day):
+    # Days since the epoch as the API's YYYY-MM-DD
+    year, month, day = time.localtime(day * 86400)[:3]
+    return f'{year:04}-{month:02}-{day:02}'
+
+def missing_days():
+    # Days before today, oldest first, that MAXFILES would keep but that
+    # have no image and haven't been asked for yet
+    today = time.time() // 86400
+    first = today - (MAXFILES - 1)
+    checked = ih.get_apod_backfill()
+    if type(checked) is int:
+        first = max(first, checked + 1)
+    return [day for day in range(first, today) if ih.blob_get(STORE, get_filename(day * 86400)) is None]
+
+def needs_network():
+    # Today's download, and any days to backfill
+    if ih.blob_get(STORE, get_filename()) is None:
+        return True
+    return BACKFILL and bool(missing_days())
+
+NEEDS_NETWORK = needs_network
+
+# ----- Log -----
+
 def clear_log():
-    if file_exists(FILELOG):
-        ih.remove_file(FILELOG)
+    for filename in (FILELOG, OLD_FILELOG):
+        if ih.file_exists(filename):
+            ih.remove_file(filename)
 
-def save_log(apod_log):
-    with open(FILELOG, 'w') as f:
-        f.write(ujson.dumps(dict(apod_log)))
-        f.flush()
+def date_key(file):
+    # (year, month, day) from nasa-apod_MM.DD.YYYY.jpg, or None
+    date = file[len(FILENAME) + 1:-4].split('.')
+    if not file.startswith(FILENAME) or len(date) != 3:
+        return None
+    return date[2], date[0], date[1]
 
-def load_log():
-    global apod_log
-    if not ih.file_exists(FILELOG):
-        print(f'Creating log {FILELOG}')
-        data = open(FILELOG, 'w')
-        data.close()
+def add_entry(file, title):
+    # Kept in date order, a backfilled day goes before the days after it
+    position = len(apod_files)
+    key = date_key(file)
+    while key is not None and position > 0:
+        before = date_key(apod_files[position - 1])
+        if before is None or before <= key:
+            break
+        position -= 1
+    apod_files.insert(position, file)
+    apod_titles[file] = title
+    apod_by_title[title] = file
+    if position == len(apod_files) - 1:
+        apod_positions[file] = position
     else:
-        print(f'Loading log {FILELOG}')
-        data = ujson.loads(open(FILELOG, 'r').read())
+        reindex()
+
+def drop_entry(file):
+    # Pruning drops from the front in one go, see prune_log()
+    title = apod_titles.pop(file, None)
+    if apod_by_title.get(title) == file:
+        del apod_by_title[title]
+    if file in apod_positions:
+        apod_files.pop(apod_positions.pop(file))
+        reindex()
+
+def reindex():
+    apod_positions.clear()
+    for position, file in enumerate(apod_files):
+        apod_positions[file] = position
+
+def append_log(record):
+    try:
+        with open(FILELOG, 'a') as f:
+            f.write(ujson.dumps(record) + '\n')
+        ih.forget(FILELOG)
+    except OSError as e:
+        print(f'Error: Failed to write {FILELOG}. {e}')
+
+def log_image(file, title):
+    add_entry(file, title)
+    append_log({'file': file, 'title': title})
+
+def unlog_image(file):
+    drop_entry(file)
+    append_log({'drop': file})
+
+def compact_log():
+    # Rewrites the log with only the images still kept
+    try:
+        with open(f'{FILELOG}.tmp', 'w') as f:
+            for file in apod_files:
+                f.write(ujson.dumps({'file': file, 'title': apod_titles[file]}) + '\n')
+        if ih.file_exists(FILELOG):
+            os.remove(FILELOG)
+        os.rename(f'{FILELOG}.tmp', FILELOG)
+        ih.forget(FILELOG)
+    except OSError as e:
+        print(f'Error: Failed to write {FILELOG}. {e}')
+
+def prune_log(count):
+    # Forgets the oldest count images
+    for file in apod_files[:count]:
+        title = apod_titles.pop(file)
+        if apod_by_title.get(title) == file:
+            del apod_by_title[title]
+    del apod_files[:count]
+    reindex()
+    compact_log()
+
+def load_log():
+    if ih.file_exists(OLD_FILELOG):
+        print(f'Converting log {OLD_FILELOG}')
+        with open(OLD_FILELOG, 'r') as f:
+            data = ujson.loads(f.read() or '{}')
         if type(data) is dict:
-            # Make sorted list
-            apod_log = sorted(data.items())
-            print('NASA APOD Log:')
-            for file, title in apod_log:
-                print(f'{file}: {title}')
+            for file, title in sorted(data.items()):
+                add_entry(file, title)
+        compact_log()
+        ih.remove_file(OLD_FILELOG)
+        return
+    if not ih.file_exists(FILELOG):
+        return
+    torn = False
+    with open(FILELOG, 'r') as f:
+        for line in f:
+            try:
+                record = ujson.loads(line)
+            except ValueError:
+                # Cut short by a power loss, skip it so later lines still count
+                torn = True
+                continue
+            if 'drop' in record:
+                drop_entry(record['drop'])
+            elif record.get('file') not in apod_titles:
+                add_entry(record['file'], record['title'])
+    if torn:
+        # Appending after a partial line would lose the next record
+        compact_log()
+    print(f'Loaded log {FILELOG}, {len(apod_files)} images')
 
 def find_title_in_apod_log(name):
-    for file, title in apod_log:
-        if name == title:
-            return file
-    return None
+    return apod_by_title.get(name)
+
+def prune():
+    # Keeps the newest MAXFILES images. Returns True if any were dropped.
+    if len(apod_files) <= MAXFILES:
+        return False
+    for file in apod_files[:len(apod_files)-MAXFILES]:
+        ih.blob_remove(STORE, file)
+    prune_log(len(apod_files)-MAXFILES)
+    return True
+
+# ----- Backfill -----
+
+def backfill():
+    # Fetches the images of the missed days, oldest first
+    days = missing_days()
+    if not days:
+        return
+    start, end = get_api_date(days[0]), get_api_date(days[-1])
+    print(f'Backfilling {len(days)} days, {start} to {end}')
+    dates = dict()
+    for day in days:
+        dates[get_api_date(day)] = day
+    # [(day, file, title, url)], read before any download so that only
+    # one connection is open at a time
+    wanted = []
+    try:
+        socket, length = ih.http_get(f'{API_URL}&start_date={start}&end_date={end}')
+        try:
+            for j in ih.json_objects(socket, API_FIELDS):
+                day = dates.get(j.get('date'))
+                if day is None or j.get('media_type') != 'image' or not j.get('url'):
+                    # Not asked for, or a video
+                    continue
+                wanted.append((day, get_filename(day * 86400), j.get('title') or j['date'], j['url']))
+        finally:
+            socket.close()
+    except (OSError, ValueError) as e:
+        print(f'Error: Backfill request failed. {e}')
+        return
+    gc.collect()
+
+    budget = BACKFILL_BYTES
+    deadline = time.ticks_add(time.ticks_ms(), BACKFILL_SECONDS * 1000)
+    # Every day up to here has been dealt with
+    checked = days[-1]
+    for day, file, title, url in wanted:
+        if budget <= 0 or time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+            print('Backfill budget used up, continuing next wake')
+            checked = day - 1
+            break
+        if find_title_in_apod_log(title):
+            print(f'Found duplicate: {find_title_in_apod_log(title)} {title}')
+            continue
+        digest = ih.blob_download(url, budget)
+        if digest is None:
+            if ih.download_failure == ih.DOWNLOAD_REFUSED or (
+                    ih.download_failure == ih.DOWNLOAD_TOO_LARGE and budget >= BACKFILL_BYTES):
+                # Gone, or too big for any wake's budget, asking again won't help
+                print(f'Skipping {title}')
+                continue
+            # Over what is left of the budget, or the network failed
+            checked = day - 1
+            break
+        budget -= ih.file_size(ih.blob_path(digest))
+        dupe = ih.blob_find(STORE, digest)
+        if dupe:
+            print(f'Found duplicate: {dupe} {title}')
+            continue
+        info = ih.probe_jpeg(ih.blob_path(digest))
+        if info is None or not info[2]:
+            # Not a JPEG, or progressive, which jpegdec can't show
+            print(f'Error: Unable to use the image for {title}')
+            ih.blob_discard(digest)
+            continue
+        ih.blob_put(STORE, file, digest)
+        log_image(file, title)
+        gc.collect()
+    ih.update_apod_backfill(checked)
 
 def update_index(index):
-    if index == len(apod_log)-1:
+    if index >= len(apod_files)-1:
         index = 0
     else:
         index += 1
     return index
 
 def get_current_index(filename):
-    index = 0
-    for file, title in apod_log:
-        if file == filename:
-            return index
-        index += 0
-    return -1
+    return apod_positions.get(filename, -1)
 
 def update():
-    global apod_log
     global index
 
     # Get index
     index = ih.get_apod_index()
 
-    # Check that image directory exists
-    if not ih.directory_exists(FILEDIR):
-        os.mkdir(FILEDIR)
+    ih.blob_import(STORE, FILEDIR)
     # Get today's date
     year, month, day, hour, minute, second, dow, _ = time.localtime()
     date = f'{month:02}.{day:02}.{year:04}'
 
-    if not apod_log:
+    if not apod_files:
         load_log()
     # Check for valid index
     if type(index) is not int:
         print(f'Error: NASA APOD index {index} is invalid. Assume 0.')
         index = 0
-    elif index > len(apod_log) - 1:
-        index = len(apod_log) - 1
-
-    if os.listdir(FILEDIR): # Downloaded files exist
-        if not apod_log: # No logged files
-            for file in sorted(os.listdir(FILEDIR)):
-                apod_log.append((file, file))
-            index = len(apod_log)-1
+    elif index > len(apod_files) - 1:
+        index = len(apod_files) - 1
+
+    files = ih.blob_keys(STORE)
+    if files: # Downloaded files exist
+        if not apod_files: # No logged files
+            for file in files:
+                log_image(file, file)
+            index = len(apod_files)-1
         # Delete extra files
-        if len(apod_log) > MAXFILES:
-            for file, title in apod_log[:len(apod_log)-MAXFILES]:
-                ih.remove_file(file)
-                apod_log.pop(0)
-            index = len(apod_log)-1
+        if prune():
+            index = len(apod_files)-1
     else:
         index = 0
 
-    filename = f'{FILENAME}_{date}.jpg'
-    if ih.file_exists(f'{FILEDIR}/{filename}'):
+    # Missed days, over the same connection as today's
+    if BACKFILL and missing_days() and ih.network_up():
+        backfill()
+
+    filename = get_filename()
+    if ih.blob_get(STORE, filename) is not None:
         # Image is already downloaded
         findindex = get_current_index(filename)
         if findindex > -1: # File found in log
@@ -126,22 +337,25 @@ def update():
                 index = findindex
         else: # Log doesn't contain file
             print(f'Warning: Image exists but not found in {FILELOG}')
-            apod_log.append((filename, '{date} Image Title Unavailable'))
-            index = len(apod_log)-1
+            log_image(filename, f'{date} Image Title Unavailable')
+            index = len(apod_files)-1
 
     else: # Download image if not downloaded already
         title = None
+        ih.network_up()
         try:
             # Grab the data
-            socket = urequest.urlopen(API_URL)
+            socket, length = ih.http_get(API_URL)
             gc.collect()
-            j = ujson.load(socket)
-            socket.close()
+            try:
+                j = ih.json_fields(socket, API_FIELDS)
+            finally:
+                socket.close()
             title = j['title']
             gc.collect()
-        except OSError as e:
+        except (OSError, ValueError, KeyError) as e:
             print(e)
-            title = '{date} Image Title Unavailable'
+            title = f'{date} Image Title Unavailable'
 
         # Check if image has duplicate in log
         dupe = find_title_in_apod_log(title)
@@ -150,33 +364,52 @@ def update():
             if status: # Cycle to next image
                 index = update_index(index)
             else:
-                index = len(apod_log)-1
+                index = len(apod_files)-1
         else:
-            try:
-                # Grab the image
-                socket = urequest.urlopen(IMG_URL)
-                gc.collect()
-
-                data = bytearray(1024)
-                with open(f'{FILEDIR}/{filename}', "wb") as f:
-                    while True:
-                        if socket.readinto(data) == 0:
-                            break
-                        f.write(data)
-                socket.close()
-                del data
-                gc.collect()
-                apod_log.append((filename, title))
-                index = len(apod_log)-1
-
-            except OSError as e:
-                print(e)
-                ih.show_error(f'Unable to download image "{title}"')
+            # Grab the image
+            gc.collect()
+            digest = ih.blob_download(IMG_URL)
+            dupe = ih.blob_find(STORE, digest) if digest else None
+            if dupe:
+                print(f'Found duplicate: {dupe} {title}')
+            elif digest:
+                ih.blob_put(STORE, filename, digest)
+                log_image(filename, title)
+                index = len(apod_files)-1
+            else:
+                print(f'Error: Unable to download image "{title}"')
 
-    save_log(apod_log)
-    print(f'Update: {apod_log}')
+    if prune():
+        index = len(apod_files)-1
+    print(f'Update: {len(apod_files)} images, showing {index}')
     ih.update_apod_index(index)
 
+def next_wake():
+    # Nothing new until the next picture is published.
+    # Retry after UPDATE_INTERVAL if today's download failed.
+    if needs_network():
+        return None
+    return ih.next_daily(PUBLISH_TIME)
+
+def get_scale(width, height):
+    # (scale, x, y) that fits the image on the display and centres it.
+    # The daily feed is already 800x480, backfilled images are not.
+    for divisor, scale in ((1, jpegdec.JPEG_SCALE_FULL), (2, jpegdec.JPEG_SCALE_HALF),
+                           (4, jpegdec.JPEG_SCALE_QUARTER), (8, jpegdec.JPEG_SCALE_EIGHTH)):
+        if width // divisor <= WIDTH and height // divisor <= HEIGHT:
+            break
+    return scale, max(0, (WIDTH - width // divisor) // 2), max(0, (HEIGHT - height // divisor) // 2)
+
+def get_image():
+    # (file, title) at the index, or None before the first download
+    if not apod_files:
+        return None
+    file = apod_files[index]
+    return file, apod_titles[file]
+
+def render_key():
+    return get_image()
+
 def draw():
     jpeg = jpegdec.JPEG(graphics)
     gc.collect()
@@ -184,15 +417,18 @@ def draw():
     graphics.set_pen(1)
     graphics.clear()
 
+    file, title = get_image() or (None, '')
     try:
         print(f'Current apod index: {index}')
-        print(f'Displaying {apod_log[index][0]}')
-        jpeg.open_file(f'{FILEDIR}/{apod_log[index][0]}')
-        jpeg.decode()
+        print(f'Displaying {file}')
+        jpeg.open_file(ih.blob_path(ih.blob_get(STORE, file)))
+        scale, x, y = get_scale(jpeg.get_width(), jpeg.get_height())
+        jpeg.decode(x, y, scale)
     except OSError:
-        if not ih.file_exists(file):
-            apod_log.pop(file)
-            save_log(apod_log)
+        # Lost from the store, it is downloaded again if it is today's
+        if file is not None:
+            ih.blob_remove(STORE, file)
+            unlog_image(file)
         graphics.set_pen(4)
         graphics.rectangle(0, (HEIGHT // 2) - 20, WIDTH, 40)
         graphics.set_pen(1)
@@ -202,6 +438,6 @@ def draw():
     graphics.set_pen(0)
     graphics.rectangle(0, HEIGHT - 25, WIDTH, 25)
     graphics.set_pen(1)
-    graphics.text(apod_log[index][1], 5, HEIGHT - 20, WIDTH, 2)
+    graphics.text(title, 5, HEIGHT - 20, WIDTH, 2)
 
     gc.collect()
\ No newline at end of file
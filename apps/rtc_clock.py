@@ -1,10 +1,7 @@
 import gc
 import time
-import uasyncio
 import inky_frame
 import inky_helper as ih
-from wifi_config import WIFI_SSID, WIFI_PASSWORD
-from network_manager import NetworkManager
 from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7 as DISPLAY  # 7.3"
 
 """
@@ -19,6 +16,9 @@ HEIGHT = None
 status = None
 UPDATE_INTERVAL = 10
 
+# Network sync result shown at the bottom of the screen
+message = None
+
 # Day of week
 DAYOFWEEK = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
 
@@ -28,18 +28,24 @@ DAYOFWEEK = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
 #            tz_offset =  9 # KST (Seoul)
 tz_offset = 9
 tz_seconds = tz_offset * 3600
-# WLAN country code
-# By default, the country setting for the PicoW's wireless network is unset
-# Examples: US (United States), KR (South Korea), GB (United Kingdom)
-country = 'KR'
-
 # Sync the Inky (always on) RTC to the Pico W so that "time.localtime()" works.
 inky_frame.pcf_to_pico_rtc()
 
-def status_handler(mode, status, ip):
-    print(mode, status, ip)
+def needs_network():
+    # Only the wakes that sync the time need the network
+    return status == 'sync' or ih.get_clock_index() == 0
+
+NEEDS_NETWORK = needs_network
+
+def get_datetime():
+    year, month, day, hour, minute, second, dow, _ = time.localtime(time.time() + tz_seconds)
+    date = f'{month:02}/{day:02}/{year:04} {DAYOFWEEK[dow]}'
+    dtime = f'{hour:02}:{minute:02}'
+    return date, dtime
 
 def update():
+    global message
+    message = None
 
     graphics.set_pen(1)
     graphics.clear()
@@ -61,35 +67,38 @@ def update():
     # Connect to the network and set the time
     index = ih.get_clock_index()
     if status == 'sync' or index == 0: # Sync time
-        connected = False
-        network_manager = NetworkManager('KR', status_handler=status_handler, client_timeout=60)
-
         t_start = time.time()
-        try:
-            uasyncio.get_event_loop().run_until_complete(network_manager.client(WIFI_SSID, WIFI_PASSWORD))
-            connected = True
-        except RuntimeError:
-            pass
+        connected = ih.network_up()
         t_end = time.time()
 
         if connected:
             inky_frame.set_time()
 
-            graphics.text(f'Set time from network... {t_end-t_start}s', 2, HEIGHT-14)
+            message = f'Set time from network... {t_end-t_start}s'
+            graphics.text(message, 2, HEIGHT-14)
             ih.update_clock_index(index+1)
         else:
-            graphics.text('Failed to connect!', 0, HEIGHT-14)
+            message = 'Failed to connect!'
+            graphics.text(message, 0, HEIGHT-14)
 
     elif index > 36: # Sync time every 36*UPDATE_INTERVAL mins
         ih.update_clock_index(0) # Reset index
+    else:
+        ih.update_clock_index(index+1)
+
 
+def next_wake():
+    # Wake on the interval boundary so the time shown is exact
+    interval = UPDATE_INTERVAL * 60
+    t = time.time() + tz_seconds
+    return t - t % interval + interval - tz_seconds
+
+def render_key():
+    return get_datetime(), message
 
 def draw():
     # Display the date and time
-    year, month, day, hour, minute, second, dow, _ = time.localtime(time.time() + tz_seconds)
-
-    date = f'{month:02}/{day:02}/{year:04} {DAYOFWEEK[dow]}'
-    dtime = f'{hour:02}:{minute:02}'
+    date, dtime = get_datetime()
 
     graphics.set_font("bitmap8")
 
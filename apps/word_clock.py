@@ -1,5 +1,7 @@
 import machine
+import time
 import ntptime
+import inky_helper as ih
 
 """
 word clock
@@ -11,6 +13,10 @@ HEIGHT = None
 status = None
 # Length of time between updates in minutes.
 UPDATE_INTERVAL = 15
+NEEDS_NETWORK = True
+
+# Minutes past the hour at which the phrase changes, see approx_time()
+CHANGES = (8, 23, 38, 53)
 
 rtc = machine.RTC()
 time_string = None
@@ -42,6 +48,7 @@ def update():
     global time_string
     # grab the current time from the ntp server and update the Pico RTC
     try:
+        ih.network_up()
         ntptime.settime()
     except OSError:
         print("Unable to contact NTP server")
@@ -55,6 +62,20 @@ def update():
     print(time_string)
 
 
+def next_wake():
+    # Wake when the phrase changes
+    t = time.time()
+    minute = t // 60 % 60
+    for change in CHANGES:
+        if change > minute:
+            return t - t % 3600 + change * 60
+    return t - t % 3600 + 3600 + CHANGES[0] * 60
+
+
+def render_key():
+    return time_string
+
+
 def draw():
     global time_string
     graphics.set_font("bitmap8")
@@ -1,11 +1,6 @@
 import gc
-import os
 import time
 import jpegdec
-import uasyncio
-from wifi_config import WIFI_SSID, WIFI_PASSWORD
-from urllib import urequest
-from network_manager import NetworkManager
 import inky_helper as ih
 
 """
@@ -27,9 +22,14 @@ status = None
 UPDATE_INTERVAL = 240
 
 FILENAME = 'xkcd-daily'
+# Comics are kept in the blob store under their file names. FILEDIR is
+# where they were saved before, it is imported once.
+STORE = 'xkcd'
 FILEDIR = '/sd/xkcd'
 FILELOG = 'xkcd-log.json'
 MAXFILES = 10
+# Roughly when the daily image is regenerated, seconds after midnight UTC
+PUBLISH_TIME = 6 * 3600
 
 ENDPOINT = 'https://pimoroni.github.io/feed2image/xkcd-800x480-daily.jpg'
 
@@ -37,26 +37,29 @@ ENDPOINT = 'https://pimoroni.github.io/feed2image/xkcd-800x480-daily.jpg'
 comic = None
 
 def update_index(comics, index):
-    if index == len(comics)-1:
+    if index >= len(comics)-1:
         index = 0
     else:
         index += 1
     return index
 
-def status_handler(mode, status, ip):
-    print(mode, status, ip)
+def get_filename():
+    # Today's comic
+    year, month, day, hour, minute, second, dow, _ = time.localtime()
+    date = f'{month:02}.{day:02}.{year:04}'
+    return f'{FILENAME}_{date}.jpg'
+
+def needs_network():
+    # Only today's download needs the network
+    return ih.blob_get(STORE, get_filename()) is None
+
+NEEDS_NETWORK = needs_network
 
 def update():
     global comic
 
-    # Make sure that image directory exists
-    if not ih.directory_exists(FILEDIR):
-        os.mkdir(FILEDIR)
-    # Get date
-    year, month, day, hour, minute, second, dow, _ = time.localtime()
-    date = f'{month:02}.{day:02}.{year:04}'
-    filename = f'{FILENAME}_{date}.jpg'
-    filepath = f'{FILEDIR}/{filename}'
+    ih.blob_import(STORE, FILEDIR)
+    filename = get_filename()
 
     # Get index
     index = ih.get_xkcd_index()
@@ -64,41 +67,29 @@ def update():
         print(f'Error: XKCD index {index} is invalid. Assume 0.')
         index = 0
     # Get files
-    comics = sorted(os.listdir(FILEDIR))
+    comics = ih.blob_keys(STORE)
     print(f'XKCD Log: {comics}')
 
     # Delete extra files
     if len(comics) > MAXFILES:
         for file in comics[:len(comics)-MAXFILES]:
-            ih.remove_file(file)
+            ih.blob_remove(STORE, file)
 
-    if not ih.file_exists(filepath):
+    if needs_network() and ih.network_up():
         # Download today's xkcd comic
-        network_manager = NetworkManager("KR", status_handler=status_handler)
-        uasyncio.get_event_loop().run_until_complete(network_manager.client(WIFI_SSID, WIFI_PASSWORD))
-        url = ENDPOINT
-
-        socket = urequest.urlopen(url)
         gc.collect() # We're really gonna need that RAM!
-
-        # Stream the image data from the socket onto disk in 1024 byte chunks
-        # the 600x448-ish jpeg will be roughly ~24k, we really don't have the RAM!
-        data = bytearray(1024)
-        with open(filepath, "wb") as f:
-            while True:
-                if socket.readinto(data) == 0:
-                    break
-                f.write(data)
-        socket.close()
-        gc.collect()  # We really are tight on RAM!
-
-        # Check if downloaded comic has duplicate
-        dupe = ih.get_duplicate(FILEDIR, filepath)
-        if dupe:
-            print(f'Found duplicate: {dupe}')
-            ih.remove_file(dupe)
-
-    comics = sorted(os.listdir(FILEDIR))
+        digest = ih.blob_download(ENDPOINT)
+        if digest:
+            gc.collect()  # We really are tight on RAM!
+
+            # The feed may not have changed since an earlier comic
+            dupe = ih.blob_find(STORE, digest)
+            ih.blob_put(STORE, filename, digest)
+            if dupe:
+                print(f'Found duplicate: {dupe}')
+                ih.blob_remove(STORE, dupe)
+
+    comics = ih.blob_keys(STORE)
     print(f'Update: {comics}')
     # Update index
     if status: # Cycle to next image
@@ -106,8 +97,18 @@ def update():
     else:
         index = len(comics)-1
     ih.update_xkcd_index(index)
-    # Choose comic to display
-    comic = comics[index]
+    # Choose comic to display, none until a download succeeds
+    comic = comics[index] if comics else None
+
+def next_wake():
+    # Nothing new until the next comic is published.
+    # Retry after UPDATE_INTERVAL if today's download failed.
+    if needs_network():
+        return None
+    return ih.next_daily(PUBLISH_TIME)
+
+def render_key():
+    return comic
 
 def draw():
     jpeg = jpegdec.JPEG(graphics)
@@ -118,7 +119,7 @@ def draw():
 
     try:
         print(f'Displaying {comic}')
-        jpeg.open_file(f'{FILEDIR}/{comic}')
+        jpeg.open_file(ih.blob_path(ih.blob_get(STORE, comic)))
         jpeg.decode()
     except OSError:
         graphics.set_pen(4)
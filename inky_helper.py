@@ -1,14 +1,21 @@
 from pimoroni_i2c import PimoroniI2C
 from pcf85063a import PCF85063A
 import math
-from machine import Pin, PWM, Timer
+import machine
+from machine import Pin, PWM, Timer, lightsleep
 import inky_frame
 import os
 import gc
 import ujson
 import time
 import network
+import rp2
+import struct
+import ubinascii
 import uhashlib
+import usocket
+import ussl
+import app_registry
 
 """
 inky helper
@@ -73,37 +80,177 @@ def stop_network_led():
 
 def sleep(t):
     # Time to have a little nap until the next update
+    return sleep_until(time.time() + 60 * t)
+
+
+# ----- Sleep until a time -----
+
+# The PCF85063A alarm matches the second, minute, hour and day, so a wake
+# can be set to the second up to a month ahead. Waits of up to
+# RTC_TIMER_MAX seconds use the countdown timer at 1 Hz instead.
+RTC_TIMER_MAX = 255
+RTC_ALARM_MAX = 28 * 86400
+
+def sleep_until(t):
+    # Powers off until time.time() reaches t. On USB power the board stays
+    # on and we wait here instead: returns the button pressed meanwhile,
+    # or None once it is time.
+    seconds = max(1, min(int(t - time.time() + 0.5), RTC_ALARM_MAX))
+    rtc.enable_alarm_interrupt(False)
+    rtc.enable_timer_interrupt(False)
+    rtc.clear_alarm_flag()
     rtc.clear_timer_flag()
-    rtc.set_timer(t, ttp=rtc.TIMER_TICK_1_OVER_60HZ)
-    rtc.enable_timer_interrupt(True)
+    if seconds <= RTC_TIMER_MAX:
+        rtc.set_timer(seconds, ttp=rtc.TIMER_TICK_1HZ)
+        rtc.enable_timer_interrupt(True)
+    else:
+        year, month, day, hour, minute, second = time.localtime(time.time() + seconds)[:6]
+        rtc.set_alarm(second, minute, hour, day)
+        rtc.enable_alarm_interrupt(True)
+    blob_flush()
+    flush_state()
+    # On USB power the next wake carries on in this process, and the SD
+    # card may have changed by then
+    fs_cache.clear()
 
-    # Set the HOLD VSYS pin to an input
-    # this allows the device to go into sleep mode when on battery power.
+    # Release the VSYS hold, this powers the board off when on battery
     hold_vsys_en_pin.init(Pin.IN)
 
-    # Regular time.sleep for those powering from USB
-    time.sleep(60 * t)
+    # Only reached when running from USB power
+    global usb_power
+    usb_power = True
+    deadline = time.ticks_add(time.ticks_ms(), seconds * 1000)
+    while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        button = read_button()
+        if button:
+            rtc.enable_alarm_interrupt(False)
+            rtc.enable_timer_interrupt(False)
+            return button
+        time.sleep_ms(BUTTON_POLL_MS)
+    return None
+
+
+# ----- Wake scheduler -----
+
+# Apps can define next_wake() returning the absolute time, in time.time()
+# seconds, of the next wake that could change the display, or None.
+# Anything else can add a deadline with request_wake(). We sleep until the
+# earliest one, or for the app's UPDATE_INTERVAL if there are none.
+wake_deadlines = []
+
+def request_wake(t):
+    wake_deadlines.append(t)
+
+def next_daily(seconds):
+    # The next time it is this many seconds past midnight
+    now = time.time()
+    t = now - now % 86400 + seconds
+    return t if t > now else t + 86400
+
+def next_wake(app):
+    deadlines = list(wake_deadlines)
+    app_next_wake = getattr(app, 'next_wake', None)
+    if callable(app_next_wake):
+        t = app_next_wake()
+        if t is not None:
+            deadlines.append(t)
+    if not deadlines:
+        return time.time() + app.UPDATE_INTERVAL * 60
+    return min(deadlines)
 
+def schedule_sleep(app):
+    # Sleeps until the next useful wake, see sleep_until()
+    t = next_wake(app)
+    del wake_deadlines[:]
+    print(f'Next wake in {int(t - time.time())} seconds')
+    return sleep_until(t)
+
+# ----- Network -----
+
+# WLAN country code, e.g. US (United States), KR (South Korea), GB (United Kingdom)
+WLAN_COUNTRY = 'KR'
+
+# The station interface while the radio is up, None while it is off
+wlan = None
+# ticks_us() when the connection was made, see network_down()
+radio_ticks = None
+# Set from the running app's NEEDS_NETWORK, see app_needs_network()
+network_allowed = True
+
+# The access point and address from the last connection are kept in
+# state['network']. The next connection goes straight to that BSSID, and
+# reuses the address as a static one while it is younger than
+# NETWORK_LEASE, skipping the scan and DHCP. If that fails we fall back to
+# a scan and DHCP. Both are recorded in the wake profile, as net_fast and
+# net_full.
+NETWORK_LEASE = 12 * 3600
+NETWORK_FAST_TIMEOUT = 3
+NETWORK_TIMEOUT = 10
+
+def wait_for_connection(timeout):
+    # Polls quickly at first, a cached association is often up within
+    # a few hundred ms, then backs off. Returns the last wlan.status().
+    deadline = time.ticks_add(time.ticks_ms(), timeout * 1000)
+    poll_ms = 20
+    while True:
+        status = wlan.status()
+        if status < 0 or status >= 3 or time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+            return status
+        time.sleep_ms(poll_ms)
+        poll_ms = min(poll_ms + 10, 100)
+
+def scan_for(SSID):
+    # The strongest access point for the SSID as (bssid, channel), or None
+    best = None
+    for ssid, bssid, channel, rssi, security, hidden in wlan.scan():
+        if ssid == SSID.encode() and (best is None or rssi > best[2]):
+            best = (bssid, channel, rssi)
+    return best and best[:2]
 
 def network_connect(SSID, PSK):
+    global wlan
     # Enable the Wireless
+    t_start = time.ticks_us()
+    rp2.country(WLAN_COUNTRY)
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
 
-    # Number of attempts to make before timeout
-    max_wait = 10
-
     # Sets the Wireless LED pulsing and attempts to connect to your local network.
     pulse_network_led()
     wlan.config(pm=0xa11140)  # Turn WiFi power saving off for some slow APs
-    wlan.connect(SSID, PSK)
 
-    while max_wait > 0:
-        if wlan.status() < 0 or wlan.status() >= 3:
-            break
-        max_wait -= 1
-        print('waiting for connection...')
-        time.sleep(1)
+    status = None
+    cached = state.get('network')
+    if cached and cached['ssid'] == SSID:
+        static = time.time() - cached['time'] < NETWORK_LEASE
+        if static:
+            wlan.ifconfig(tuple(cached['ifconfig']))
+        # With the channel too the join skips sweeping the band for the BSSID
+        wlan.connect(SSID, PSK, bssid=ubinascii.unhexlify(cached['bssid']),
+                     channel=cached['channel'])
+        status = wait_for_connection(NETWORK_FAST_TIMEOUT)
+        t_end = time.ticks_us()
+        profile_add('net_fast', time.ticks_diff(t_end, t_start))
+        t_start = t_end
+        if status != 3:
+            print(f'Cached access point did not answer ({status}), scanning')
+            wlan.disconnect()
+            if static:
+                wlan.ifconfig('dhcp')
+        elif not static:
+            remember_network(SSID, cached['bssid'], cached['channel'])
+
+    if status != 3:
+        found = scan_for(SSID)
+        if found:
+            wlan.connect(SSID, PSK, bssid=found[0], channel=found[1])
+        else:
+            # Hidden SSIDs don't show up in a scan
+            wlan.connect(SSID, PSK)
+        status = wait_for_connection(NETWORK_TIMEOUT)
+        profile_add('net_full', time.ticks_diff(time.ticks_us(), t_start))
+        if status == 3 and found:
+            remember_network(SSID, ubinascii.hexlify(found[0]).decode(), found[1])
 
     stop_network_led()
     network_led_pwm.duty_u16(30000)
@@ -113,6 +260,693 @@ def network_connect(SSID, PSK):
         stop_network_led()
         led_warn.on()
 
+def remember_network(SSID, bssid, channel):
+    # After a DHCP lease, for the next network_connect()
+    set_state('network', {'ssid': SSID, 'bssid': bssid, 'channel': channel,
+                          'ifconfig': list(wlan.ifconfig()), 'time': time.time()})
+
+def app_after_refresh(app):
+    # Apps can declare after_refresh() for SD card work that can wait until
+    # the display is done. It runs on this core, not core1, because the SD
+    # card shares SPI0 with the display, so it can't overlap the refresh.
+    after_refresh = getattr(app, 'after_refresh', None)
+    if not callable(after_refresh):
+        return
+    try:
+        after_refresh()
+    except Exception as e:
+        print(f'Error: after_refresh() failed. {e}')
+
+def app_needs_network(app):
+    # Apps declare NEEDS_NETWORK as a bool, or as a function returning one
+    # when it depends on what the wake has to do. Undeclared means offline.
+    needs = getattr(app, 'NEEDS_NETWORK', False)
+    if callable(needs):
+        needs = needs()
+    return bool(needs)
+
+def network_up():
+    # Brings the radio up on the first request of the wake.
+    # Later calls reuse the same connection.
+    if wlan is not None and wlan.isconnected():
+        return True
+    if not network_allowed:
+        print('Error: Network requested but the app does not declare NEEDS_NETWORK')
+        return False
+    try:
+        from wifi_config import WIFI_SSID, WIFI_PASSWORD
+    except ImportError:
+        print("Update wifi_config.py with your WiFi credentials")
+        return False
+
+    global radio_ticks
+    network_connect(WIFI_SSID, WIFI_PASSWORD)
+    radio_ticks = time.ticks_us()
+    return wlan.isconnected()
+
+def network_down():
+    # Powers the radio down, called before the display refresh
+    global wlan, radio_ticks, radio_held
+    if wlan is None:
+        return
+    wlan.disconnect()
+    wlan.active(False)
+    wlan = None
+    stop_network_led()
+    if radio_ticks is not None:
+        radio_held += time.ticks_diff(time.ticks_us(), radio_ticks)
+        radio_ticks = None
+
+# ----- Downloads -----
+
+# Files are fetched with our own small HTTP/1.0 client, because urequest
+# drops the response headers. The body goes through one DOWNLOAD_BUFFER
+# sized buffer into {filename}.part. It is hashed on the way and checked
+# against Content-Length, and is only renamed into place once complete,
+# so a dropped connection never leaves a truncated file behind.
+DOWNLOAD_BUFFER = 8192
+DOWNLOAD_TIMEOUT = 20
+DOWNLOAD_REDIRECTS = 3
+# Why the last download() returned None, for callers deciding whether to
+# try again later: the file was over max_bytes, the server answered 4xx,
+# or anything else, e.g. the connection dropped
+DOWNLOAD_TOO_LARGE = 'too large'
+DOWNLOAD_REFUSED = 'refused'
+DOWNLOAD_FAILED = 'failed'
+download_failure = None
+# Status code of the last response http_get() read
+http_status = None
+
+def split_url(url):
+    # (secure, host, port, path)
+    scheme, _, rest = url.partition('://')
+    host, _, path = rest.partition('/')
+    secure = scheme == 'https'
+    port = 443 if secure else 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    return secure, host, port, '/' + path
+
+def join_url(url, location):
+    # Resolves a Location header against the URL it redirects from
+    if '://' in location:
+        return location
+    scheme, _, rest = url.partition('://')
+    host, _, path = rest.partition('/')
+    if location.startswith('//'):
+        return f'{scheme}:{location}'
+    if location.startswith('/'):
+        return f'{scheme}://{host}{location}'
+    path = '/' + path.split('?', 1)[0]
+    return f'{scheme}://{host}{path[:path.rfind("/") + 1]}{location}'
+
+def http_get(url):
+    # Sends the request and reads the headers, following redirects.
+    # Returns (socket, Content-Length or None) with the body still to be
+    # read, or raises OSError.
+    global http_status
+    http_status = None
+    for redirect in range(DOWNLOAD_REDIRECTS + 1):
+        secure, host, port, path = split_url(url)
+        address = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)[0][-1]
+        s = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
+        try:
+            s.settimeout(DOWNLOAD_TIMEOUT)
+            s.connect(address)
+            if secure:
+                s = ussl.wrap_socket(s, server_hostname=host)
+            s.write(f'GET {path} HTTP/1.0\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+            line = s.readline().split(None, 2)
+            if len(line) < 2:
+                raise OSError(f'No response from {host}')
+            code = int(line[1])
+            http_status = code
+            length = None
+            location = None
+            while True:
+                line = s.readline()
+                if not line or line == b'\r\n':
+                    break
+                name, _, value = line.decode().partition(':')
+                name = name.strip().lower()
+                if name == 'content-length':
+                    length = int(value)
+                elif name == 'location':
+                    location = value.strip()
+        except (ValueError, UnicodeError) as e:
+            # A malformed status line or header
+            s.close()
+            raise OSError(f'Bad response from {host}. {e}')
+        except Exception:
+            s.close()
+            raise
+        if 300 <= code < 400 and location:
+            s.close()
+            url = join_url(url, location)
+            continue
+        if code != 200:
+            s.close()
+            raise OSError(f'HTTP {code} from {host}')
+        return s, length
+    raise OSError(f'Too many redirects from {url}')
+
+def download(url, filename, buffer_size=DOWNLOAD_BUFFER, max_bytes=None):
+    # Returns the hex SHA-256 of the file, or None if the download failed.
+    # With max_bytes, a larger file fails without being read, or as soon as
+    # it passes max_bytes when the server doesn't send Content-Length.
+    global download_failure
+    part = f'{filename}.part'
+    hash = uhashlib.sha256()
+    received = 0
+    download_failure = None
+    try:
+        s, length = http_get(url)
+        if max_bytes is not None and length is not None and length > max_bytes:
+            s.close()
+            download_failure = DOWNLOAD_TOO_LARGE
+            raise OSError(f'{length} bytes is over the limit of {max_bytes}')
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        try:
+            with open(part, 'wb') as f:
+                while True:
+                    # Fill the buffer so the SD card gets few, large writes
+                    filled = 0
+                    while filled < buffer_size:
+                        n = s.readinto(view[filled:])
+                        if not n:
+                            break
+                        filled += n
+                    if not filled:
+                        break
+                    f.write(view[:filled])
+                    hash.update(view[:filled])
+                    received += filled
+                    if max_bytes is not None and received > max_bytes:
+                        download_failure = DOWNLOAD_TOO_LARGE
+                        raise OSError(f'Over the limit of {max_bytes} bytes')
+                    if filled < buffer_size:
+                        break
+        finally:
+            s.close()
+            del view, buffer
+            gc.collect()
+        forget(part)
+        if length is not None and received != length:
+            raise OSError(f'Received {received} of {length} bytes')
+        if file_exists(filename):
+            os.remove(filename)
+        os.rename(part, filename)
+    except OSError as e:
+        print(f'Error: Failed to download {url}. {e}')
+        if download_failure is None:
+            refused = http_status is not None and 400 <= http_status < 500
+            download_failure = DOWNLOAD_REFUSED if refused else DOWNLOAD_FAILED
+        forget(part)
+        if file_exists(part):
+            remove_file(part)
+        return None
+    forget(part)
+    forget(filename)
+    print(f'Downloaded {filename}, {received} bytes')
+    return ubinascii.hexlify(hash.digest()).decode()
+
+# ----- JPEG headers -----
+
+# jpegdec only decodes baseline JPEGs, so files are checked before they
+# are kept or shown
+def probe_jpeg(filename):
+    # (width, height, baseline) from the SOF segment, reading only the
+    # marker headers in front of it. None if it isn't a JPEG.
+    with open(filename, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        position = 2
+        while True:
+            data = f.read(4)
+            if len(data) < 4 or data[0] != 0xff:
+                return None
+            marker = data[1]
+            if marker == 0xff:
+                # Fill byte
+                position += 1
+                f.seek(position)
+                continue
+            if marker == 0xda or marker == 0xd9:
+                # Start of scan or end of image, no frame header
+                return None
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                data = f.read(5)
+                if len(data) < 5:
+                    return None
+                height, width = struct.unpack('>HH', data[1:])
+                # 0xc0 and 0xc1 are baseline, the rest progressive,
+                # lossless or arithmetic coded
+                return width, height, marker <= 0xc1
+            position += 2 + (data[2] << 8 | data[3])
+            f.seek(position)
+
+# ----- Streaming JSON -----
+
+# Picks a few top-level fields out of a JSON document as it streams in,
+# e.g. an API response, through one JSON_CHUNK sized buffer. The values
+# of other keys, like a long description, are skipped without being kept,
+# so memory use does not grow with the document. Strings, numbers, true,
+# false and null can be extracted; objects and arrays are skipped.
+JSON_CHUNK = 256
+
+JSON_ESCAPES = {0x62: 0x08, 0x66: 0x0c, 0x6e: 0x0a, 0x72: 0x0d, 0x74: 0x09}
+# Byte values, as ints so `b in` works the same on MicroPython
+JSON_SPACE = (0x20, 0x09, 0x0d, 0x0a)
+JSON_END = (0x2c, 0x7d, 0x5d) + JSON_SPACE
+
+class JSONReader:
+    def __init__(self, stream, chunk=JSON_CHUNK):
+        self.stream = stream
+        self.buffer = bytearray(chunk)
+        self.length = 0
+        self.position = 0
+        # Bytes handed back by unread(), last in first out
+        self.pending = []
+
+    def next(self):
+        # The next byte, or -1 at the end of the stream
+        if self.pending:
+            return self.pending.pop()
+        if self.position >= self.length:
+            self.length = self.stream.readinto(self.buffer) or 0
+            self.position = 0
+            if not self.length:
+                return -1
+        b = self.buffer[self.position]
+        self.position += 1
+        return b
+
+    def unread(self, data):
+        # Makes next() return these bytes again, in order
+        for b in reversed(data):
+            self.pending.append(b)
+
+    def skip_space(self):
+        # The next byte that isn't white space
+        b = self.next()
+        while b in JSON_SPACE:
+            b = self.next()
+        return b
+
+    def hex4(self):
+        digits = bytearray(4)
+        for i in range(4):
+            digits[i] = self.next()
+        return int(digits, 16)
+
+    def low_surrogate(self):
+        # The \uXXXX low surrogate that should follow a high one, or None
+        # with the bytes left unread
+        b = self.next()
+        if b != 0x5c:
+            if b != -1:
+                self.unread((b,))
+            return None
+        b = self.next()
+        if b != 0x75:
+            self.unread((0x5c,) if b == -1 else (0x5c, b))
+            return None
+        code = self.hex4()
+        if 0xdc00 <= code < 0xe000:
+            return code
+        self.unread(f'\\u{code:04x}'.encode())
+        return None
+
+    def string(self, keep):
+        # Reads up to the closing quote. Returns the string, or None when
+        # it isn't kept.
+        out = bytearray() if keep else None
+        while True:
+            b = self.next()
+            if b == -1:
+                raise ValueError('JSON ends inside a string')
+            if b == 0x22:  # "
+                return out.decode() if keep else None
+            if b == 0x5c:  # \
+                b = self.next()
+                if b == 0x75:  # \uXXXX
+                    code = self.hex4()
+                    if 0xd800 <= code < 0xdc00:
+                        low = self.low_surrogate()
+                        # A lone surrogate can't be encoded, use U+FFFD
+                        code = 0xfffd if low is None else 0x10000 + (code - 0xd800 << 10) + (low - 0xdc00)
+                    elif 0xdc00 <= code < 0xe000:
+                        code = 0xfffd
+                    if keep:
+                        out += chr(code).encode()
+                    continue
+                b = JSON_ESCAPES.get(b, b)
+            if keep:
+                out.append(b)
+
+    def value(self, b, keep):
+        # Reads the value that starts with b. Returns (value, the next byte
+        # that isn't white space), with value None when it isn't kept.
+        if b == 0x22:
+            return self.string(keep), self.skip_space()
+        if b == 0x7b or b == 0x5b:  # { [
+            depth = 1
+            while depth:
+                b = self.next()
+                if b == -1:
+                    raise ValueError('JSON ends inside a value')
+                if b == 0x22:
+                    self.string(False)
+                elif b == 0x7b or b == 0x5b:
+                    depth += 1
+                elif b == 0x7d or b == 0x5d:  # } ]
+                    depth -= 1
+            return None, self.skip_space()
+        literal = bytearray()
+        while b != -1 and b not in JSON_END:
+            literal.append(b)
+            b = self.next()
+        if b in JSON_SPACE:
+            b = self.skip_space()
+        if not keep:
+            return None, b
+        literal = literal.decode()
+        if literal == 'true':
+            return True, b
+        if literal == 'false':
+            return False, b
+        if literal == 'null':
+            return None, b
+        for c in '.eE':
+            if c in literal:
+                return float(literal), b
+        return int(literal), b
+
+    def members(self, keys, finish=True):
+        # Reads an object after its opening brace, returning {key: value}
+        # for the keys asked for. Without finish it stops reading as soon
+        # as it has them all.
+        found = dict()
+        b = self.skip_space()
+        if b == 0x7d:
+            return found
+        while True:
+            if b != 0x22:
+                raise ValueError('Expected a JSON key')
+            key = self.string(True)
+            if self.skip_space() != 0x3a:  # :
+                raise ValueError('Expected : after a JSON key')
+            keep = key in keys
+            value, b = self.value(self.skip_space(), keep)
+            if keep:
+                found[key] = value
+                if not finish and len(found) == len(keys):
+                    return found
+            if b == 0x7d:
+                return found
+            if b != 0x2c:  # ,
+                raise ValueError('Expected , or } in a JSON object')
+            b = self.skip_space()
+
+def json_fields(stream, keys, chunk=JSON_CHUNK):
+    # {key: value} for the keys found in the object the stream holds.
+    # Reading stops once they have all been found.
+    reader = JSONReader(stream, chunk)
+    if reader.skip_space() != 0x7b:
+        raise ValueError('Expected a JSON object')
+    return reader.members(keys, False)
+
+def json_objects(stream, keys, chunk=JSON_CHUNK):
+    # Yields {key: value} for each object in the array the stream holds,
+    # or for the one object if it isn't an array
+    reader = JSONReader(stream, chunk)
+    b = reader.skip_space()
+    if b == 0x7b:
+        yield reader.members(keys)
+        return
+    if b != 0x5b:
+        raise ValueError('Expected a JSON array')
+    b = reader.skip_space()
+    while b != 0x5d:
+        if b != 0x7b:
+            raise ValueError('Expected a JSON object')
+        yield reader.members(keys)
+        b = reader.skip_space()
+        if b == 0x2c:
+            b = reader.skip_space()
+        elif b != 0x5d:
+            raise ValueError('Expected , or ] in a JSON array')
+
+# ----- Wake profiler -----
+
+# Phase timings are kept in RAM while awake and written out once per wake,
+# just before sleep, into a fixed-size ring buffer on the SD card.
+# Copy the file to a computer and run tools/wake_report.py to summarise it.
+PROFILE_FILE = '/sd/wake_profile.bin'
+PROFILE_SLOTS = 1024
+PROFILE_MAGIC = b'IFWP'
+# magic, number of slots, next slot to write, wake counter
+PROFILE_HEADER = '<4sHHI'
+# wake, app, phase, duration (us), gc.mem_free(), gc.mem_alloc()
+PROFILE_RECORD = '<I16s12sIII'
+
+profile = []
+profile_ticks = None
+
+def profile_start():
+    global profile, profile_ticks
+    profile = []
+    profile_ticks = time.ticks_us()
+
+def profile_mark(phase):
+    # Ends the phase that has been running since the previous mark
+    global profile_ticks
+    now = time.ticks_us()
+    if profile_ticks is None:
+        profile_ticks = now
+    profile.append((phase, time.ticks_diff(now, profile_ticks), gc.mem_free(), gc.mem_alloc()))
+    profile_ticks = time.ticks_us()
+
+def profile_add(phase, duration):
+    # Records a phase that ran inside the current one, e.g. a network
+    # connection made from app.update(), and takes it out of that phase
+    global profile_ticks
+    profile.append((phase, duration, gc.mem_free(), gc.mem_alloc()))
+    if profile_ticks is not None:
+        profile_ticks = time.ticks_add(profile_ticks, duration)
+
+def profile_flush(app_name):
+    global profile
+    if not profile or not directory_exists('/sd'):
+        return
+    header_size = struct.calcsize(PROFILE_HEADER)
+    record_size = struct.calcsize(PROFILE_RECORD)
+    try:
+        f = None
+        slot, wake = 0, 0
+        if file_exists(PROFILE_FILE):
+            f = open(PROFILE_FILE, 'r+b')
+            data = f.read(header_size)
+            if len(data) == header_size:
+                magic, slots, head, count = struct.unpack(PROFILE_HEADER, data)
+            else:
+                # Cut short before its header was written
+                magic = None
+            if magic == PROFILE_MAGIC and slots == PROFILE_SLOTS:
+                slot, wake = head, count
+            else:
+                # Different layout, start a new buffer
+                f.close()
+                f = None
+        if f is None:
+            f = open(PROFILE_FILE, 'wb')
+        wake += 1
+        with f:
+            for phase, duration, mem_free, mem_alloc in profile:
+                f.seek(header_size + slot * record_size)
+                f.write(struct.pack(PROFILE_RECORD, wake, app_name.encode(), phase.encode(), duration, mem_free, mem_alloc))
+                slot = (slot + 1) % PROFILE_SLOTS
+            f.seek(0)
+            f.write(struct.pack(PROFILE_HEADER, PROFILE_MAGIC, PROFILE_SLOTS, slot, wake))
+    except (OSError, ValueError) as e:
+        print(f'Error: Failed to write {PROFILE_FILE}. {e}')
+    forget(PROFILE_FILE)
+    profile = []
+
+# ----- Energy accounting -----
+
+# The charge used by each wake is estimated from its profile, see
+# profile_mark(), and added up per app in state.json with the sleep that
+# came before it. Measure your own board with a USB power meter and adjust
+# the figures below.
+
+# Average current in mA while in each kind of phase
+CURRENT_MA = {'cpu': 30, 'sd': 40, 'radio': 75, 'refresh': 35, 'sleep': 0.02}
+# Profile phases that are not plain CPU time
+PHASE_CURRENT = {'sdcard': 'sd', 'net_fast': 'radio', 'net_full': 'radio', 'refresh': 'refresh',
+                 'launcher': 'refresh'}
+# Capacity of the battery pack in mAh, 3 x AA alkaline
+BATTERY_MAH = 2000
+
+# Microseconds the radio stayed up after connecting, in whatever phases
+# were running at the time
+radio_held = 0
+
+def wake_charge():
+    # Charge in mAs used by this wake so far
+    charge = 0
+    for phase, duration, mem_free, mem_alloc in profile:
+        charge += duration * CURRENT_MA[PHASE_CURRENT.get(phase, 'cpu')]
+    charge += radio_held * (CURRENT_MA['radio'] - CURRENT_MA['cpu'])
+    return charge / 1000000
+
+def account_energy(app_name):
+    # Adds this wake, and the sleep before it, to the app's totals.
+    # Call once per wake, before profile_flush() and flush_state().
+    global radio_held
+    now = time.time()
+    awake = sum(p[1] for p in profile) / 1000000
+    charge = wake_charge()
+    seconds = awake
+    last = state.get('energy_last')
+    if last is not None:
+        # Clock changes (e.g. an NTP sync) and long power cuts are not sleeps
+        sleep = now - awake - last
+        if 0 < sleep < 2 * 86400:
+            charge += sleep * CURRENT_MA['sleep']
+            seconds += sleep
+    radio_held = 0
+
+    # wakes, seconds and mAs
+    totals = state['energy'].setdefault(app_name, [0, 0, 0])
+    totals[0] += 1
+    totals[1] = round(totals[1] + seconds, 1)
+    totals[2] = round(totals[2] + charge, 1)
+    mark_dirty('energy')
+    set_state('energy_last', now)
+    if not on_usb_power():
+        if state.get('battery_since') is None:
+            set_state('battery_since', now)
+        set_state('battery_used', round(state.get('battery_used', 0) + charge, 1))
+
+    message = f'Energy: {charge:.1f} mAs this wake'
+    cost = app_cost(app_name)
+    if cost is not None:
+        message += f', {app_name} {cost:.2f} mAh/day'
+    forecast = battery_forecast()
+    if forecast is not None:
+        message += f', battery empty around {format_date(forecast)}'
+    print(message)
+
+def app_cost(app_name):
+    # Average mAh per day used by the app, awake and asleep, or None
+    totals = state['energy'].get(app_name)
+    if not totals or totals[1] < 3600:
+        return None
+    return totals[2] / totals[1] * 86400 / 3600
+
+def new_battery():
+    # Starts counting from a full battery
+    set_state('battery_since', None)
+    set_state('battery_used', 0)
+
+def fresh_battery():
+    # A power-on from battery that no alarm or button caused. This is also
+    # what the reset button looks like, so it restarts the count too.
+    return (machine.reset_cause() == machine.PWRON_RESET and not inky_frame.woken_by_rtc()
+            and not inky_frame.woken_by_button() and not on_usb_power())
+
+def battery_forecast():
+    # time.time() when the battery should run out, or None before a day
+    # of battery use has been counted
+    since = state.get('battery_since')
+    used = state.get('battery_used', 0)
+    if since is None or used <= 0 or time.time() - since < 86400:
+        return None
+    rate = used / (time.time() - since)
+    return time.time() + max(0, BATTERY_MAH * 3600 - used) / rate
+
+def format_date(t):
+    year, month, day = time.localtime(int(t))[:3]
+    return f'{year}-{month:02}-{day:02}'
+
+# ----- Skip unchanged display refreshes -----
+
+def render_fingerprint(app):
+    # Apps declare render_key(), returning everything draw() depends on, so
+    # the check runs before drawing. The 7.3" keeps its framebuffer in
+    # PSRAM, so there is nothing to hash after drawing. None without one.
+    render_key = getattr(app, 'render_key', None)
+    if not callable(render_key):
+        return None
+    hash = uhashlib.sha256(get_app().encode())
+    hash.update(repr(render_key()).encode())
+    return ubinascii.hexlify(hash.digest()[:8]).decode()
+
+def content_changed(fingerprint):
+    # Counts the refreshes skipped because the screen already shows this
+    if fingerprint is not None and fingerprint == get_fingerprint():
+        set_state('skipped_refreshes', get_skipped_refreshes() + 1)
+        return False
+    return True
+
+# ----- Wait for a button -----
+
+# The buttons sit behind a shift register with no interrupt line, so they
+# are polled from a low power wait. After BUTTON_TIMEOUT seconds with no
+# press we power down, and a later press wakes us through woken_by_button().
+BUTTON_TIMEOUT = 120
+BUTTON_POLL_MS = 50
+
+buttons = {'a': inky_frame.button_a, 'b': inky_frame.button_b, 'c': inky_frame.button_c,
+           'd': inky_frame.button_d, 'e': inky_frame.button_e}
+
+# True or False once known for this boot, see on_usb_power()
+usb_power = None
+
+def on_usb_power():
+    # VBUS sense on the Pico W is read through the wireless chip, which
+    # powers it up and loads its firmware. A wake by the RTC or a button
+    # means the board was off, which it only is on battery, and
+    # sleep_until() only returns on USB power, so the chip is only asked
+    # after a plain power-on or reset.
+    global usb_power
+    if usb_power is None:
+        if inky_frame.woken_by_rtc() or inky_frame.woken_by_button():
+            usb_power = False
+        else:
+            usb_power = Pin('WL_GPIO2', Pin.IN).value() == 1
+    return usb_power
+
+def read_button():
+    # The first button held down, 'a' to 'e', or None
+    for name in 'abcde':
+        if buttons[name].read():
+            return name
+    return None
+
+def wait_for_button(timeout=BUTTON_TIMEOUT):
+    # Returns the pressed button, 'a' to 'e', or None after the timeout.
+    # On battery the timeout never returns, the board powers off.
+    usb = on_usb_power()
+    deadline = time.ticks_add(time.ticks_ms(), timeout * 1000)
+    while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        button = read_button()
+        if button:
+            return button
+        if usb:
+            # lightsleep would drop the USB connection
+            time.sleep_ms(BUTTON_POLL_MS)
+        else:
+            lightsleep(BUTTON_POLL_MS)
+
+    # Release the VSYS hold, this powers the board off when on battery
+    flush_state()
+    hold_vsys_en_pin.init(Pin.IN)
+    return None
+
 # ----- Turn off button LEDs -----
 
 def clear_button_leds():
@@ -125,47 +959,331 @@ def clear_button_leds():
 
 # ----- Check if file or directory exists -----
 
-def file_exists(filename):
+# Directory listings are read once per wake with os.ilistdir() and kept as
+# {directory: {name: (type, size)}}. file_exists() and directory_exists()
+# answer from them. The helpers below that write or remove files drop the
+# listing they change; anything writing with open() directly calls forget().
+# sleep_until() clears them all, for wakes that stay on USB power.
+fs_cache = dict()
+
+def split_path(path):
+    # '/sd/photos/a.jpg' -> ('/sd/photos', 'a.jpg'), relative paths are in /
+    path = path.rstrip('/')
+    directory, _, name = path.rpartition('/')
+    if not path.startswith('/'):
+        directory = '/' + directory
+    return directory or '/', name
+
+def list_dir(directory):
+    # {name: (type, size)} for the directory, raises OSError if missing
+    directory = directory.rstrip('/') or '/'
+    entries = fs_cache.get(directory)
+    if entries is None:
+        entries = dict()
+        for entry in os.ilistdir(directory):
+            entries[entry[0]] = (entry[1], entry[3] if len(entry) > 3 else -1)
+        fs_cache[directory] = entries
+    return entries
+
+def listdir(directory):
+    # Like sorted(os.listdir(directory))
+    return sorted(list_dir(directory))
+
+def path_info(path):
+    # (type, size) or None if the path doesn't exist
+    directory, name = split_path(path)
+    if not name:
+        return (0x4000, -1)
     try:
-        return (os.stat(filename)[0] & 0x4000) == 0
+        return list_dir(directory).get(name)
     except OSError:
-        return False
+        return None
+
+def file_exists(filename):
+    info = path_info(filename)
+    return info is not None and (info[0] & 0x4000) == 0
 
 def directory_exists(dirname):
-    try:
-        return (os.stat(dirname)[0] & 0x4000) != 0
-    except OSError:
-        return False
+    info = path_info(dirname)
+    return info is not None and (info[0] & 0x4000) != 0
+
+def file_size(filename):
+    info = path_info(filename)
+    return info[1] if info is not None else -1
+
+def forget(path):
+    # Call after creating, writing or removing path
+    fs_cache.pop(split_path(path)[0], None)
+    fs_cache.pop(path.rstrip('/') or '/', None)
+
+def make_dir(dirname):
+    if not directory_exists(dirname):
+        os.mkdir(dirname)
+        forget(dirname)
 
 # ----- Check for duplicate files -----
 
+# Identical files are found in passes: files are grouped by size, files of
+# the same size by a hash of their first and last DEDUP_EDGE bytes, and only
+# files that still match are hashed in full. Full digests are kept in a
+# sidecar file beside the directory, {directory}.sums, as
+# {name: [size, mtime, digest]}, until the file's size or mtime changes.
+# Files with a digest there are grouped by it without being read.
+DEDUP_EDGE = 4096
+
+# Every file is read through this one buffer
+hash_buffer = bytearray(1024)
+
+def hash_file(f, hash, length=-1):
+    # Feeds length bytes from f into hash, or up to the end if negative
+    view = memoryview(hash_buffer)
+    while length:
+        n = f.readinto(view if length < 0 else view[:min(length, len(view))])
+        if not n:
+            break
+        hash.update(view[:n])
+        if length > 0:
+            length -= n
+
 def get_checksum(filename):
-    gc.collect()
     hash = uhashlib.sha256()
     with open(filename, 'rb') as f:
-        while chunk := f.read(1024):
-            hash.update(chunk)
-    gc.collect()
+        hash_file(f, hash)
     return hash.digest()
 
-def get_duplicate(directory, filepath):
-    file_checksum = get_checksum(filepath)
-    for file in os.listdir(directory):
-        fp = f'{directory}/{file}'
-        if fp != filepath:
-            if file_checksum == get_checksum(fp):
-                return fp
-    return None
+def get_edge_checksum(filename, size):
+    # Hash of the start and end of the file
+    hash = uhashlib.sha256()
+    with open(filename, 'rb') as f:
+        hash_file(f, hash, DEDUP_EDGE)
+        if size > DEDUP_EDGE:
+            f.seek(max(DEDUP_EDGE, size - DEDUP_EDGE))
+            hash_file(f, hash, DEDUP_EDGE)
+    return hash.digest()
+
+def load_checksums(directory):
+    # Returns {name: [size, mtime, digest]} for the files in the directory,
+    # with digest None where it is not known, and whether that differs
+    # from the sidecar
+    sidecar = f'{directory}.sums'
+    sums = dict()
+    if file_exists(sidecar):
+        try:
+            with open(sidecar, 'r') as f:
+                sums = ujson.loads(f.read())
+        except (OSError, ValueError) as e:
+            print(f'Error: Failed to read {sidecar}. {e}')
+
+    changed = False
+    found = dict()
+    for name, info in list_dir(directory).items():
+        if info[0] & 0x4000:
+            continue
+        st = os.stat(f'{directory}/{name}')
+        known = sums.get(name)
+        if known and known[0] == st[6] and known[1] == st[8]:
+            found[name] = known
+        else:
+            found[name] = [st[6], st[8], None]
+            changed = True
+    return found, changed or len(found) != len(sums)
 
-def remove_duplicates(directory):
-    files_by_hash = dict()
-    for file in os.listdir(directory):
-        filepath = f'{directory}/{file}'
-        checksum = get_checksum(filepath)
-        if checksum in files_by_hash:
-            remove_file(filepath)
+def save_checksums(directory, sums):
+    sidecar = f'{directory}.sums'
+    try:
+        with open(sidecar, 'w') as f:
+            f.write(ujson.dumps(sums))
+        forget(sidecar)
+    except OSError as e:
+        print(f'Error: Failed to write {sidecar}. {e}')
+        remove_file(sidecar)
+
+def find_duplicates(directory, name=None):
+    # Returns {digest: [name, ...]} for every set of identical files, each
+    # sorted by name. With a name, only the set that contains it.
+    sums, changed = load_checksums(directory)
+
+    by_size = dict()
+    for file in sorted(sums):
+        by_size.setdefault(sums[file][0], []).append(file)
+
+    duplicates = dict()
+    for size, same_size in by_size.items():
+        if len(same_size) < 2 or name is not None and name not in same_size:
+            continue
+        unknown = [file for file in same_size if sums[file][2] is None]
+        if len(unknown) < len(same_size):
+            # Comparing with a known digest needs the full hash
+            full = unknown
         else:
-            files_by_hash[checksum] = filepath
+            # Only files whose edges match another's need the full hash
+            by_edge = dict()
+            for file in unknown:
+                edge = get_edge_checksum(f'{directory}/{file}', size)
+                if size <= 2 * DEDUP_EDGE:
+                    # The edges cover the whole file
+                    sums[file][2] = ubinascii.hexlify(edge).decode()
+                    changed = True
+                by_edge.setdefault(edge, []).append(file)
+            full = [file for same_edge in by_edge.values() if len(same_edge) > 1 for file in same_edge]
+        for file in full:
+            if sums[file][2] is None:
+                sums[file][2] = ubinascii.hexlify(get_checksum(f'{directory}/{file}')).decode()
+                changed = True
+
+        by_digest = dict()
+        for file in same_size:
+            if sums[file][2] is not None:
+                by_digest.setdefault(sums[file][2], []).append(file)
+        for digest, same in by_digest.items():
+            if len(same) > 1 and (name is None or name in same):
+                duplicates[digest] = same
+
+    if changed:
+        save_checksums(directory, sums)
+    return duplicates
+
+# ----- Blob store -----
+
+# Downloaded images are kept once, named by their SHA-256, in BLOB_DIR.
+# Each app keeps an index from its own keys, e.g. a file name or a title,
+# to digests in {BLOB_DIR}/{app}.idx. BLOB_REFS counts the index entries
+# that point at each blob, and a blob is deleted with its last one.
+# Changes are kept in RAM and written by blob_flush() before sleep.
+BLOB_DIR = '/sd/blobs'
+BLOB_REFS = f'{BLOB_DIR}/refs.json'
+BLOB_INCOMING = f'{BLOB_DIR}/incoming'
+
+# {app: {key: digest}}, loaded when first used
+blob_indexes = dict()
+# {digest: references}
+blob_refs = None
+# Apps whose index changed, and 'refs'
+blob_dirty = set()
+
+def blob_path(digest):
+    return f'{BLOB_DIR}/{digest}'
+
+def read_json(filename, default):
+    if not file_exists(filename):
+        return default
+    try:
+        with open(filename, 'r') as f:
+            return ujson.loads(f.read())
+    except (OSError, ValueError) as e:
+        print(f'Error: Failed to read {filename}. {e}')
+        return default
+
+def blob_index(name):
+    global blob_refs
+    if blob_refs is None:
+        blob_refs = read_json(BLOB_REFS, dict())
+    if name not in blob_indexes:
+        blob_indexes[name] = read_json(f'{BLOB_DIR}/{name}.idx', dict())
+    return blob_indexes[name]
+
+def blob_keys(name):
+    return sorted(blob_index(name))
+
+def blob_get(name, key):
+    # The digest stored under key, or None
+    return blob_index(name).get(key)
+
+def blob_find(name, digest):
+    # A key of the app that refers to digest, or None
+    for key, value in blob_index(name).items():
+        if value == digest:
+            return key
+    return None
+
+def blob_put(name, key, digest):
+    index = blob_index(name)
+    old = index.get(key)
+    if old == digest:
+        return
+    index[key] = digest
+    blob_refs[digest] = blob_refs.get(digest, 0) + 1
+    blob_dirty.add(name)
+    blob_dirty.add('refs')
+    if old is not None:
+        blob_release(old)
+
+def blob_remove(name, key):
+    index = blob_index(name)
+    digest = index.pop(key, None)
+    if digest is not None:
+        blob_dirty.add(name)
+        blob_release(digest)
+
+def blob_release(digest):
+    count = blob_refs.get(digest, 0) - 1
+    blob_dirty.add('refs')
+    if count > 0:
+        blob_refs[digest] = count
+        return
+    blob_refs.pop(digest, None)
+    if file_exists(blob_path(digest)):
+        remove_file(blob_path(digest))
+
+def blob_keep(filename, digest):
+    # Moves a file into the store, unless the blob is already there
+    if file_exists(blob_path(digest)):
+        print(f'Already stored as {digest}')
+        remove_file(filename)
+    else:
+        os.rename(filename, blob_path(digest))
+        forget(filename)
+        forget(blob_path(digest))
+    return digest
+
+def blob_download(url, max_bytes=None):
+    # Downloads into the store. Returns the digest, or None if the download
+    # failed. Pass the digest to blob_put() or blob_discard().
+    make_dir(BLOB_DIR)
+    digest = download(url, BLOB_INCOMING, max_bytes=max_bytes)
+    if digest is None:
+        return None
+    return blob_keep(BLOB_INCOMING, digest)
+
+def blob_discard(digest):
+    # Deletes a downloaded blob, unless an index refers to it
+    if not blob_refs.get(digest) and file_exists(blob_path(digest)):
+        remove_file(blob_path(digest))
+
+def blob_import(name, directory):
+    # Moves the files an app kept in a directory of its own into the
+    # store, keyed by file name, and removes the directory
+    if not directory_exists(directory):
+        return
+    make_dir(BLOB_DIR)
+    for file in listdir(directory):
+        filename = f'{directory}/{file}'
+        if file.endswith('.part'):
+            remove_file(filename)
+            continue
+        print(f'Importing {filename}')
+        digest = ubinascii.hexlify(get_checksum(filename)).decode()
+        blob_put(name, file, blob_keep(filename, digest))
+    os.rmdir(directory)
+    forget(directory)
+    # The files have moved, don't wait for sleep to record where
+    blob_flush()
+
+def blob_flush():
+    # Writes the changed indexes, then the reference counts
+    for name in sorted(blob_dirty, key=lambda name: name == 'refs'):
+        filename = BLOB_REFS if name == 'refs' else f'{BLOB_DIR}/{name}.idx'
+        data = blob_refs if name == 'refs' else blob_indexes[name]
+        try:
+            with open(f'{filename}.tmp', 'w') as f:
+                f.write(ujson.dumps(data))
+            if file_exists(filename):
+                os.remove(filename)
+            os.rename(f'{filename}.tmp', filename)
+            forget(filename)
+        except OSError as e:
+            print(f'Error: Failed to write {filename}. {e}')
+    blob_dirty.clear()
 
 def remove_file(filename):
     try:
@@ -173,26 +1291,93 @@ def remove_file(filename):
         os.remove(filename)
     except Exception as e:
         print(f'Error: Failed to delete {filename}. {e}')
+    forget(filename)
 
 # ----- Handle App state -----
 
-state = {'run': 'image_gallery', 'photo_index': 0, 'apod_index': 0, 'xkcd_index': 0, 'clock_index': 0}
+# Changes are kept in RAM and written once per wake by flush_state(), as
+# one JSON line appended to STATE_LOG with just the keys that changed.
+# load_state() replays the log over the STATE_FILE snapshot. When the log
+# grows past STATE_LOG_SIZE it is compacted into a new snapshot, written
+# to a temporary file and renamed over the old one. A line cut short by a
+# power loss is ignored, so state.json is never left half written.
+STATE_FILE = '/state.json'
+STATE_TEMP = '/state.tmp'
+STATE_LOG = '/state.log'
+STATE_LOG_SIZE = 4096
+
+state = {'run': 'image_gallery', 'photo_index': 0, 'apod_index': 0, 'apod_backfill': None, 'xkcd_index': 0, 'clock_index': 0,
+         'photo_shuffle': None, 'fingerprint': None, 'skipped_refreshes': 0,
+         'energy': {}, 'energy_last': None, 'battery_since': None, 'battery_used': 0, 'network': None}
+# Keys changed since the last flush_state()
+state_dirty = set()
 app = None
 
 def clear_state():
-    if file_exists('state.json'):
-        os.remove('state.json')
+    for filename in (STATE_FILE, STATE_LOG):
+        if file_exists(filename):
+            os.remove(filename)
+            forget(filename)
+
+def set_state(key, value):
+    if state.get(key) != value:
+        state[key] = value
+        state_dirty.add(key)
+
+def mark_dirty(key):
+    # For values changed in place, e.g. the lists in state['energy']
+    state_dirty.add(key)
 
 def save_state(data):
-    with open('/state.json', 'w') as f:
+    # Writes a complete snapshot and starts a new log
+    with open(STATE_TEMP, 'w') as f:
         f.write(ujson.dumps(data))
-        f.flush()
+    os.rename(STATE_TEMP, STATE_FILE)
+    if file_exists(STATE_LOG):
+        os.remove(STATE_LOG)
+    forget(STATE_FILE)
+
+def flush_state():
+    # Call once at the end of the wake, before the board powers off
+    if not state_dirty:
+        return
+    changes = dict()
+    for key in state_dirty:
+        changes[key] = state[key]
+    try:
+        with open(STATE_LOG, 'a') as f:
+            f.write(ujson.dumps(changes) + '\n')
+            size = f.tell()
+        forget(STATE_LOG)
+        if size > STATE_LOG_SIZE:
+            save_state(state)
+        state_dirty.clear()
+    except OSError as e:
+        print(f'Error: Failed to write {STATE_LOG}. {e}')
 
 def load_state():
-    global state
-    data = ujson.loads(open('/state.json', 'r').read())
+    if not file_exists(STATE_FILE):
+        # First run, start from the defaults
+        save_state(state)
+        return
+    with open(STATE_FILE, 'r') as f:
+        data = ujson.loads(f.read())
     if type(data) is dict:
-        state = data
+        # Keys missing from an older state.json keep their defaults
+        state.update(data)
+    if not file_exists(STATE_LOG):
+        return
+    torn = False
+    with open(STATE_LOG, 'r') as f:
+        for line in f:
+            try:
+                state.update(ujson.loads(line))
+            except ValueError:
+                # Cut short by a power loss. Later lines are still good,
+                # but appending after this one would lose the next change.
+                torn = True
+    if torn:
+        save_state(state)
 
 def get_app():
     return state['run']
@@ -203,47 +1388,54 @@ def get_cycle():
 def get_index():
     return state['photo_index']
 
+def get_shuffle():
+    return state.get('photo_shuffle')
+
 def get_apod_index():
     return state['apod_index']
 
+def get_apod_backfill():
+    return state.get('apod_backfill')
+
 def get_xkcd_index():
     return state['xkcd_index']
 
 def get_clock_index():
     return state['clock_index']
 
+def get_fingerprint():
+    return state.get('fingerprint')
+
+def get_skipped_refreshes():
+    return state.get('skipped_refreshes', 0)
+
 def update_app(app):
-    global state
-    state['run'] = app
-    save_state(state)
+    set_state('run', app)
 
 def update_cycle(cycle):
-    global state
-    if state['photo_cycle'] != cycle:
-        state['photo_cycle'] = cycle
-        save_state(state)
+    set_state('photo_cycle', cycle)
 
 def update_index(index):
-    global state
-    state['photo_index'] = index
-    save_state(state)
+    set_state('photo_index', index)
+
+def update_shuffle(shuffle):
+    set_state('photo_shuffle', shuffle)
 
 def update_apod_index(index):
-    global state
-    state['apod_index'] = index
-    save_state(state)
+    set_state('apod_index', index)
+
+def update_apod_backfill(day):
+    set_state('apod_backfill', day)
 
 def update_xkcd_index(index):
-    global state
-    state['apod_index'] = index
-    save_state(state)
+    set_state('xkcd_index', index)
 
 def update_clock_index(index):
-    global state
-    state['clock_index'] = index
-    save_state(state)
+    set_state('clock_index', index)
+
+def update_fingerprint(fingerprint):
+    set_state('fingerprint', fingerprint)
 
 def launch_app(app_name):
     global app
-    app = __import__(f'apps/{app_name}')
-    update_app(app_name)
\ No newline at end of file
+    app = app_registry.load(app_name)
\ No newline at end of file
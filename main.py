@@ -5,6 +5,7 @@ import sdcard
 from machine import Pin, SPI, reset
 import inky_frame
 import inky_helper as ih
+import app_registry
 from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7 as DISPLAY  # 7.3"
 
 """
@@ -23,9 +24,15 @@ https://github.com/pimoroni/pimoroni-pico/tree/main/micropython/modules/picograp
 
 """
 
+# Time each phase of the wake, see ih.profile_flush()
+ih.profile_start()
+
 # A short delay to give USB chance to initialise
 time.sleep(0.5)
 
+# Sync the Inky (always on) RTC to the Pico W so that "time.localtime()" works.
+inky_frame.pcf_to_pico_rtc()
+
 # Status variable to be passed to the app
 status = '>>'
 status_change = None
@@ -34,20 +41,37 @@ status_change = None
 graphics = PicoGraphics(DISPLAY)
 WIDTH, HEIGHT = graphics.get_bounds()
 graphics.set_font("bitmap8")
+ih.profile_mark('boot')
 
 def setup_sdcard():
     # set up the SD card
     sd_spi = SPI(0, sck=Pin(18, Pin.OUT), mosi=Pin(19, Pin.OUT), miso=Pin(16, Pin.OUT))
     sd = sdcard.SDCard(sd_spi, Pin(22))
-    if not 'sd' in os.listdir(): # check if SD is mounted
+    if not ih.directory_exists('/sd'): # check if SD is mounted
         try:
             os.mount(sd, '/sd')
         except OSError as e:
             print(e)
             graphics.text(e, 0, 40)
+        ih.forget('/sd')
 
 
-def launcher():
+# Launcher menu, one row per button: button, label, pen colour and app
+LAUNCHER_MENU = app_registry.launcher_menu()
+
+
+def launcher_energy():
+    # Battery forecast and the mAh per day of each menu entry, see ih.account_energy()
+    forecast = ih.battery_forecast()
+    battery = f'Battery empty around {ih.format_date(forecast)}' if forecast else ''
+    costs = []
+    for button, label, pen, app in LAUNCHER_MENU:
+        cost = ih.app_cost(app)
+        costs.append('' if cost is None else f'{cost:.1f}')
+    return battery, costs
+
+
+def draw_launcher(battery, costs):
     # Inky Frame 7.3"
     y_offset = 35
 
@@ -63,125 +87,72 @@ def launcher():
     title_len = graphics.measure_text(title, 4) // 2
     graphics.text(title, (WIDTH // 2 - title_len), 10, WIDTH, 4)
 
-    graphics.set_pen(4)
-    graphics.rectangle(30, HEIGHT - (340 + y_offset), WIDTH - 100, 50)
-    graphics.set_pen(1)
-    graphics.text("A. << Photo", 35, HEIGHT - (325 + y_offset), 600, 3)
+    for row, (button, label, pen, app) in enumerate(LAUNCHER_MENU):
+        top = HEIGHT - (340 - 60 * row + y_offset)
+        width = 100 + 50 * row
+        graphics.set_pen(pen)
+        graphics.rectangle(30, top, WIDTH - width, 50)
+        graphics.set_pen(1)
+        graphics.text(label, 35, top + 15, 600, 3)
 
-    graphics.set_pen(6)
-    graphics.rectangle(30, HEIGHT - (280 + y_offset), WIDTH - 150, 50)
-    graphics.set_pen(1)
-    graphics.text("B. Photo >>", 35, HEIGHT - (265 + y_offset), 600, 3)
-
-    graphics.set_pen(2)
-    graphics.rectangle(30, HEIGHT - (220 + y_offset), WIDTH - 200, 50)
-    graphics.set_pen(1)
-    graphics.text("C. NASA Picture of the Day", 35, HEIGHT - (205 + y_offset), 600, 3)
-
-    graphics.set_pen(3)
-    graphics.rectangle(30, HEIGHT - (160 + y_offset), WIDTH - 250, 50)
-    graphics.set_pen(1)
-    graphics.text("D. RTC Clock", 35, HEIGHT - (145 + y_offset), 600, 3)
+    graphics.set_pen(graphics.create_pen(220, 220, 220))
+    for row in range(len(LAUNCHER_MENU)):
+        top = HEIGHT - (340 - 60 * row + y_offset)
+        width = 100 + 50 * row
+        graphics.rectangle(WIDTH - width, top, width - 30, 50)
 
     graphics.set_pen(0)
-    graphics.rectangle(30, HEIGHT - (100 + y_offset), WIDTH - 300, 50)
-    graphics.set_pen(1)
-    graphics.text("E. XKCD Daily", 35, HEIGHT - (85 + y_offset), 600, 3)
-
-    graphics.set_pen(graphics.create_pen(220, 220, 220))
-    graphics.rectangle(WIDTH - 100, HEIGHT - (340 + y_offset), 70, 50)
-    graphics.rectangle(WIDTH - 150, HEIGHT - (280 + y_offset), 120, 50)
-    graphics.rectangle(WIDTH - 200, HEIGHT - (220 + y_offset), 170, 50)
-    graphics.rectangle(WIDTH - 250, HEIGHT - (160 + y_offset), 220, 50)
-    graphics.rectangle(WIDTH - 300, HEIGHT - (100 + y_offset), 270, 50)
+    graphics.text(battery, 30, 70, 600, 2)
+    if any(costs):
+        graphics.text("mAh/day", WIDTH - 30 - graphics.measure_text("mAh/day", 2), 70, 600, 2)
+    for row, cost in enumerate(costs):
+        top = HEIGHT - (340 - 60 * row + y_offset)
+        width = 100 + 50 * row
+        graphics.text(cost, WIDTH - width + 5, top + 18, 600, 2)
 
     graphics.set_pen(0)
     note = "Hold A + E, then press Reset, to return to the Launcher"
     note_len = graphics.measure_text(note, 2) // 2
     graphics.text(note, (WIDTH // 2 - note_len), HEIGHT - 30, 600, 2)
 
+
+def launcher():
+    ih.load_state()
+
+    battery, costs = launcher_energy()
+    draw_launcher(battery, costs)
+
     ih.led_warn.on()
     graphics.update()
     ih.led_warn.off()
+    # The app has to redraw over the launcher
+    ih.update_fingerprint(None)
+    ih.profile_mark('launcher')
+    ih.account_energy('launcher')
+    ih.profile_flush('launcher')
 
     # Now we've drawn the menu to the screen, we wait here for the user to select an app.
     # Then once an app is selected, we set that as the current app and reset the device and load into it.
     while True:
-        if ih.inky_frame.button_a.read():
-            inky_frame.button_a.led_on()
-            ih.update_app('image_gallery')
-            reset()
-        if ih.inky_frame.button_b.read():
-            inky_frame.button_b.led_on()
-            ih.update_app('image_gallery')
-            reset()
-        if ih.inky_frame.button_c.read():
-            inky_frame.button_c.led_on()
-            ih.update_app('nasa_apod')
-            reset()
-        if ih.inky_frame.button_d.read():
-            inky_frame.button_d.led_on()
-            ih.update_app('xkcd_daily')
-            reset()
-        if ih.inky_frame.button_e.read():
-            inky_frame.button_e.led_on()
-            ih.update_app('rtc_clock')
-            reset()
-
-
-def select_app():
+        pressed = ih.wait_for_button()
+        for button, label, pen, app in LAUNCHER_MENU:
+            if button == pressed:
+                ih.buttons[button].led_on()
+                ih.update_app(app)
+                ih.flush_state()
+                reset()
+
+
+def select_app(button=None):
     global status
     global status_change
 
-    if ih.inky_frame.button_a.read():
-        inky_frame.button_a.led_on()
-        ih.update_app('image_gallery')
-        if ih.get_app() == 'image_gallery':
-            status = '<<'
-            status_change = None
-        else:
-            status = None
-            status_change = '<<'
-
-    elif ih.inky_frame.button_b.read():
-        inky_frame.button_b.led_on()
-        ih.update_app('image_gallery')
-        if ih.get_app() == 'image_gallery':
-            status = '>>'
-            status_change = None
-        else:
-            status = None
-            status_change = '>>'
-
-    elif ih.inky_frame.button_c.read():
-        inky_frame.button_c.led_on()
-        ih.update_app('nasa_apod')
-        if ih.get_app() == 'nasa_apod':
-            status = '>>'
-            status_change = None
-        else:
-            status = None
-            status_change = '>>'
-
-    elif ih.inky_frame.button_d.read():
-        inky_frame.button_d.led_on()
-        ih.update_app('xkcd_daily')
-        if ih.get_app() == 'xkcd_daily':
-            status = '>>'
-            status_change = None
-        else:
-            status = None
-            status_change = '>>'
-
-    elif ih.inky_frame.button_e.read():
-        inky_frame.button_e.led_on()
-        ih.update_app('rtc_clock')
-        if ih.get_app() == 'rtc_clock':
-            status = 'wait'
-            status_change = None
-        else:
-            status = 'sync'
-            status_change = 'wait'
+    # A button pressed while waiting on USB power, or held at boot
+    button = button or ih.read_button()
+    if button:
+        ih.buttons[button].led_on()
+        app, status, status_change = app_registry.select(button, ih.get_app())
+        ih.update_app(app)
 
     elif status_change:
         status = status_change
@@ -190,22 +161,21 @@ def select_app():
 
 def load_app():
     # Launches the app
-    ih.load_state()
     ih.launch_app(ih.get_app())
+    ih.profile_mark('import')
 
     # Passes the the graphics object from the launcher to the app
     ih.app.graphics = graphics
     ih.app.WIDTH = WIDTH
     ih.app.HEIGHT = HEIGHT
     ih.app.status = status
-    
+
+    # The radio is only brought up if the app asks for it, see ih.network_up()
+    ih.network_allowed = ih.app_needs_network(ih.app)
+
     # Check that SD card is mounted
-    if not 'sd' in os.listdir():
-        try:
-            os.mount(sd, '/sd')
-        except OSError as e:
-            print(e)
-            graphics.text(e, 0, 40)
+    if not ih.directory_exists('/sd'):
+        setup_sdcard()
     gc.collect()
 
 # Display error
@@ -227,20 +197,20 @@ ih.clear_button_leds()
 ih.led_warn.off()
 # SD card setup
 setup_sdcard()
+ih.profile_mark('sdcard')
 
 if ih.inky_frame.button_a.read() and ih.inky_frame.button_e.read():
     launcher()
-elif ih.file_exists("state.json"):
-    load_app()
-    ih.update_clock_index(0)
-else:
+elif not ih.file_exists("state.json"):
     launcher()
-
-try:
-    from wifi_config import WIFI_SSID, WIFI_PASSWORD
-    ih.network_connect(WIFI_SSID, WIFI_PASSWORD)
-except ImportError:
-    print("Update wifi_config.py with your WiFi credentials")
+ih.load_state()
+# The clock syncs on its first wake after a power-on, reset or button
+# press. RTC wakes count on towards the next sync, see rtc_clock.
+if not inky_frame.woken_by_rtc():
+    ih.update_clock_index(0)
+if ih.fresh_battery():
+    ih.new_battery()
+ih.profile_mark('state')
 
 # Get some memory back, we really need it!
 gc.collect()
@@ -250,19 +220,44 @@ gc.collect()
 
 print('state.json exists:', ih.file_exists("state.json"))
 
+woken = inky_frame.woken_by_rtc() or inky_frame.woken_by_button()
+button = None
 while True:
-    if inky_frame.woken_by_rtc() or inky_frame.woken_by_button():
-        select_app()
+    if woken:
+        select_app(button)
+        ih.profile_mark('select')
         load_app()
         #print(f'state: {ih.state}')
         #print(f'app: {ih.get_app()}')
         #print(f'status {status} status_change {status_change}')
         ih.app.update()
+        ih.profile_mark('update')
+        # Radio off before the long display refresh
+        ih.network_down()
         ih.led_warn.on()
-        ih.app.draw()
+        # Apps without a render_key() always redraw
+        fingerprint = ih.render_fingerprint(ih.app)
+        changed = ih.content_changed(fingerprint)
+        if changed:
+            ih.app.draw()
+        ih.profile_mark('draw')
         #show_caption(f'{ih.get_app()} status {status}')
-        graphics.update()
+        if changed:
+            graphics.update()
+            ih.update_fingerprint(fingerprint)
+            ih.profile_mark('refresh')
+        else:
+            print(f'Display unchanged, skipped refresh ({ih.get_skipped_refreshes()} so far)')
+        ih.app_after_refresh(ih.app)
+        ih.profile_mark('after')
         ih.led_warn.off()
         ih.clear_button_leds()
         gc.collect()
-    inky_frame.sleep_for(ih.app.UPDATE_INTERVAL)
\ No newline at end of file
+    if ih.app is None:
+        load_app()
+    ih.account_energy(ih.get_app())
+    ih.profile_flush(ih.get_app())
+    button = ih.schedule_sleep(ih.app)
+    # Only reached when running from USB power
+    woken = True
+    ih.profile_start()
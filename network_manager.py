@@ -51,9 +51,11 @@ class NetworkManager:
             self._ap_if.disconnect()
 
     async def wait(self, mode):
+        poll_ms = 20
         while not self.isconnected():
             self._handle_status(mode, None)
-            await uasyncio.sleep_ms(1000)
+            await uasyncio.sleep_ms(poll_ms)
+            poll_ms = min(poll_ms * 2, 1000)
 
     def _handle_status(self, mode, status):
         if callable(self._status_handler):
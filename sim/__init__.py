@@ -0,0 +1,14 @@
+"""
+sim
+
+A host-side simulator for the Inky Frame. It runs main.py, inky_helper
+and the apps unchanged under CPython, with stand-ins for the MicroPython
+and Pimoroni modules:
+
+- the SD card and internal flash are directories on the host
+- the network is a local HTTP stub server answering from fixtures
+- every graphics.update() writes a PNG
+- time runs on a virtual clock, so sleeps and slow hardware cost nothing
+
+Run python -m sim --help. Host tools only, not copied to the device.
+"""
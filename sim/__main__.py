@@ -0,0 +1,108 @@
+import argparse
+import calendar
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sim.board import Board
+from sim.device import ROOT, Device
+from sim.fixtures import make_internet, make_photos
+from sim.stubserver import StubServer
+
+"""
+Runs main.py on a simulated Inky Frame.
+
+python -m sim --app image_gallery --photos 50 --wakes 5
+python -m sim --app xkcd_daily --wakes 3 --report
+python -m sim --wakes 2 --press 1:c        # launcher, then press C
+python -m sim --usb --wakes 4 --press 3:b  # on USB, press B before wake 3
+
+Flash, SD card and output default to a temporary directory. Each display
+refresh is written as a PNG. --report summarises the wake profile that
+inky_helper wrote to the SD card.
+"""
+
+
+def parse_press(values):
+    # '3:ae' holds A and E while wake 3 boots, '3:ae>c' then presses C
+    buttons = dict()
+    for value in values or ():
+        wake, keys = value.split(':', 1)
+        held, _, queued = keys.partition('>')
+        buttons[int(wake)] = (tuple(held), tuple(queued))
+    return buttons
+
+
+def parse_time(value):
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%S'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m sim', description='Run main.py on a simulated Inky Frame.')
+    parser.add_argument('--wakes', type=int, default=3, help='number of wakes to run (default 3)')
+    parser.add_argument('--app', help='app to start with when the flash has no state.json')
+    parser.add_argument('--dir', help='keep flash/, sd/, out/ and internet/ here instead of a temporary directory')
+    parser.add_argument('--flash', help='directory used as the internal flash')
+    parser.add_argument('--sd', help='directory used as the SD card')
+    parser.add_argument('--out', help='directory for the PNG of each refresh')
+    parser.add_argument('--fixtures', help='directory answering HTTP requests, see sim/stubserver.py')
+    parser.add_argument('--photos', type=int, default=0, help='generate this many photos in /sd/photos if empty')
+    parser.add_argument('--start', type=parse_time, help='UTC start time, YYYY-MM-DDTHH:MM:SS')
+    parser.add_argument('--usb', action='store_true', help='run on USB power, the board never turns off')
+    parser.add_argument('--hours', type=float, help='stop after this many hours of virtual time')
+    parser.add_argument('--framebuffer', action='store_true', help='let memoryview(graphics) reach the framebuffer')
+    parser.add_argument('--press', action='append', metavar='WAKE:HELD[>PRESSED]', help='buttons for a wake')
+    parser.add_argument('--cost', action='append', metavar='NAME=SECONDS', help='override a hardware cost in sim.board.COSTS')
+    parser.add_argument('--memory', action='store_true', help='trace memory so gc.mem_free() means something')
+    parser.add_argument('--report', action='store_true', help='print the wake profile report at the end')
+    args = parser.parse_args(argv)
+
+    base = args.dir or tempfile.mkdtemp(prefix='inky-sim-')
+    flash = args.flash or os.path.join(base, 'flash')
+    sd = args.sd or os.path.join(base, 'sd')
+    out = args.out or os.path.join(base, 'out')
+    for path in (flash, sd, out):
+        os.makedirs(path, exist_ok=True)
+    if args.photos and not os.listdir(sd) or args.photos and not os.path.isdir(os.path.join(sd, 'photos')):
+        make_photos(os.path.join(sd, 'photos'), args.photos)
+    if args.app and not os.path.exists(os.path.join(flash, 'state.json')):
+        with open(os.path.join(flash, 'state.json'), 'w') as f:
+            json.dump({'run': args.app}, f)
+    fixtures = args.fixtures or make_internet(os.path.join(base, 'internet'))
+    costs = dict()
+    for value in args.cost or ():
+        name, seconds = value.split('=', 1)
+        costs[name] = float(seconds)
+
+    server = StubServer(fixtures).start()
+    start = args.start if args.start is not None else time.time()
+    board = Board(flash, sd, start=start, usb=args.usb, framebuffer=args.framebuffer, out=out,
+                  network_url=server.url, costs=costs,
+                  until=start + args.hours * 3600 if args.hours else None)
+    print(f'[sim] flash {flash}, sd {sd}, out {out}')
+    if args.memory:
+        tracemalloc.start()
+    try:
+        Device(board).run(args.wakes, parse_press(args.press))
+    finally:
+        server.stop()
+
+    elapsed = board.clock.time() - start
+    print(f'[sim] {board.wakes} wakes, {board.refreshes} refreshes over {elapsed / 3600:.1f} h')
+    if board.wakes:
+        print(f'[sim] awake {board.awake_seconds:.1f} s ({board.awake_seconds / board.wakes:.1f} s per wake), '
+              f'radio on {board.radio_seconds:.1f} s')
+
+    profile = os.path.join(sd, 'wake_profile.bin')
+    if args.report and os.path.exists(profile):
+        sys.path.insert(0, os.path.join(ROOT, 'tools'))
+        import wake_report
+        wake_report.print_report(wake_report.summarise(wake_report.read_profile(profile)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
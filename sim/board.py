@@ -0,0 +1,235 @@
+import contextlib
+import gc
+import os
+import time
+import tracemalloc
+
+"""
+board
+
+The simulated hardware shared by all the stand-in modules: a virtual
+clock, the internal flash and SD card mapped to host directories, the
+buttons, the PCF85063A alarm and the radio.
+
+A Board outlives device reboots. Each wake re-imports main.py and the
+device modules, just like the real thing.
+"""
+
+# Set by sim.device.Device, read by the stand-in modules
+board = None
+
+# Inky Frame 7.3" palette, indexed by pen
+PALETTE = (
+    (0, 0, 0),        # black
+    (255, 255, 255),  # white
+    (0, 255, 0),      # green
+    (0, 0, 255),      # blue
+    (255, 0, 0),      # red
+    (255, 255, 0),    # yellow
+    (255, 128, 0),    # orange
+    (220, 180, 200),  # taupe
+)
+
+# Virtual seconds charged for slow hardware, so wakes take realistic time
+COSTS = {
+    'refresh': 35.0,       # full refresh of the 7.3" panel
+    'jpeg_decode': 2.5,    # decoding and dithering 800x480 at full scale
+    'wifi_scan': 1.5,      # finding the access point
+    'wifi_assoc': 0.4,     # association with a known BSSID and channel
+    'wifi_dhcp': 1.2,      # getting an address
+}
+
+
+class PowerOff(BaseException):
+    # The VSYS hold was released on battery, the board turns off
+    pass
+
+
+class Reset(BaseException):
+    # machine.reset()
+    pass
+
+
+class StopSimulation(BaseException):
+    pass
+
+
+class Clock:
+    # Real elapsed time plus the time skipped by sleeps, so the profile
+    # shows the real cost of the Python code without waiting for sleeps
+    def __init__(self, start):
+        self._epoch = start
+        self._offset = 0.0
+        self._t0 = time.perf_counter()
+
+    def monotonic(self):
+        return time.perf_counter() - self._t0 + self._offset
+
+    def time(self):
+        return self._epoch + self.monotonic()
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self._offset += seconds
+
+    def exclude(self, seconds):
+        # Takes back time spent in the simulator itself
+        self._offset -= seconds
+
+    def set_time(self, t):
+        self._epoch += t - self.time()
+
+
+class Board:
+    def __init__(self, flash, sd, start=None, usb=False, framebuffer=False, out=None,
+                 network_url=None, costs=None, max_wakes=None, until=None):
+        self.flash = flash
+        self.sd = sd
+        self.usb = usb
+        self.framebuffer = framebuffer
+        self.out = out
+        self.network_url = network_url
+        self.costs = dict(COSTS)
+        if costs:
+            self.costs.update(costs)
+        self.clock = Clock(time.time() if start is None else start)
+        # The simulation stops after this many wakes or at this time
+        self.max_wakes = max_wakes
+        self.until = until
+        # Buttons for a wake number: (held at boot, pressed after the first refresh)
+        self.presses = dict()
+
+        # Per wake
+        self.sd_mounted = False
+        self.wake_reason = 'power'
+        self.held = set()
+        self.queued = set()
+        self.radio_on = None
+        self.usb_released = False
+        # State of peripherals that lose power when the board turns off
+        self.devices = dict()
+        self.memory_base = 0
+
+        # RTC alarm and timer, as absolute times
+        self.alarm = None
+        self.timer = None
+
+        # The access point takes the name of the first SSID asked for
+        self.ap_ssid = None
+
+        # Totals
+        self.wakes = 0
+        self.refreshes = 0
+        self.radio_seconds = 0.0
+        self.awake_seconds = 0.0
+        self.frames = []
+
+    # ----- Wakes -----
+
+    def begin_wake(self, reason, held=(), queued=()):
+        self.wakes += 1
+        self.wake_reason = reason
+        self.held = set(held)
+        self.queued = set(queued)
+        self.usb_released = False
+        self.sd_mounted = False
+        self.radio_on = None
+        self.devices = dict()
+        self.memory_base = 0
+        if tracemalloc.is_tracing():
+            # Drop the last boot's modules before taking the baseline
+            gc.collect()
+            self.memory_base = tracemalloc.get_traced_memory()[0]
+        self._wake_start = self.clock.monotonic()
+
+    @contextlib.contextmanager
+    def uncounted(self):
+        # Leaves the simulator's own work out of the clock and gc.mem_alloc()
+        before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.clock.exclude(time.perf_counter() - t0)
+            if tracemalloc.is_tracing():
+                gc.collect()
+                self.memory_base += tracemalloc.get_traced_memory()[0] - before
+
+    def end_wake(self):
+        self.radio(False)
+        self.awake_seconds += self.clock.monotonic() - self._wake_start
+
+    def release_buttons(self):
+        # Buttons held at boot are let go during the first display refresh,
+        # then any queued presses happen
+        self.held = self.queued
+        self.queued = set()
+
+    def sleep(self, seconds):
+        # Any wait on the device
+        if self.usb_released:
+            self._usb_wake()
+            return
+        self.clock.advance(seconds)
+        if self.until is not None and self.clock.time() >= self.until:
+            raise StopSimulation()
+
+    def _usb_wake(self):
+        # VSYS was released on USB power, so the board is still on. The
+        # first wait after that lasts until the RTC alarm, or until a
+        # press given for the next wake.
+        self.end_wake()
+        if self.max_wakes is not None and self.wakes >= self.max_wakes:
+            raise StopSimulation()
+        held, queued = self.presses.get(self.wakes + 1, ((), ()))
+        alarm = self.next_alarm()
+        if held:
+            reason = 'button'
+            self.clock.advance(1)
+        elif alarm is not None:
+            reason = 'rtc'
+            self.clock.advance(alarm - self.clock.time())
+        else:
+            print('[sim] Waiting on USB power with no alarm set')
+            raise StopSimulation()
+        if self.until is not None and self.clock.time() >= self.until:
+            raise StopSimulation()
+        self.alarm = None
+        self.timer = None
+        self.usb_released = False
+        self.wakes += 1
+        self.wake_reason = reason
+        self.held = set(held)
+        self.queued = set(queued)
+        self._wake_start = self.clock.monotonic()
+
+    def power_off(self):
+        # VSYS hold released. On USB power the board keeps running.
+        if not self.usb:
+            raise PowerOff()
+        self.usb_released = True
+
+    def next_alarm(self):
+        wakes = [t for t in (self.alarm, self.timer) if t is not None]
+        return min(wakes) if wakes else None
+
+    # ----- Radio -----
+
+    def radio(self, on):
+        now = self.clock.monotonic()
+        if on and self.radio_on is None:
+            self.radio_on = now
+        elif not on and self.radio_on is not None:
+            self.radio_seconds += now - self.radio_on
+            self.radio_on = None
+
+    # ----- Filesystem -----
+
+    def path(self, path):
+        # Maps a device path to the host
+        if not path.startswith('/'):
+            path = '/' + path
+        parts = [p for p in path.split('/') if p and p != '.']
+        if parts and parts[0] == 'sd' and self.sd_mounted:
+            return os.path.join(self.sd, *parts[1:])
+        return os.path.join(self.flash, *parts)
@@ -0,0 +1,170 @@
+import builtins
+import importlib
+import os
+import sys
+import traceback
+
+from sim import board as board_module
+from sim.board import PowerOff, Reset, StopSimulation
+
+"""
+device
+
+Runs main.py and the apps under CPython. Device code gets its own
+builtins: open() goes through the simulated filesystem and imports of
+MicroPython and Pimoroni modules are answered by the stand-ins in
+sim/modules. Every wake starts from a fresh set of device modules.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Device module name: stand-in module
+STAND_INS = {
+    'os': 'sim.modules.uos',
+    'uos': 'sim.modules.uos',
+    'time': 'sim.modules.utime',
+    'utime': 'sim.modules.utime',
+    'gc': 'sim.modules.ugc',
+    'micropython': 'sim.modules.micropython',
+    'machine': 'sim.modules.machine',
+    'network': 'sim.modules.network',
+    'rp2': 'sim.modules.rp2',
+    'sdcard': 'sim.modules.sdcard',
+    'pcf85063a': 'sim.modules.pcf85063a',
+    'pimoroni_i2c': 'sim.modules.pimoroni_i2c',
+    'picographics': 'sim.modules.picographics',
+    'jpegdec': 'sim.modules.jpegdec',
+    'inky_frame': 'sim.modules.inky_frame',
+    'urllib': 'sim.modules.urllib',
+    'urllib.urequest': 'sim.modules.urllib.urequest',
+    'ntptime': 'sim.modules.ntptime',
+    'uasyncio': 'sim.modules.uasyncio',
+    'usocket': 'sim.modules.usocket',
+    'ussl': 'sim.modules.ussl',
+    'ujson': 'json',
+    'uhashlib': 'hashlib',
+    'ubinascii': 'binascii',
+    'ucollections': 'collections',
+    'ustruct': 'struct',
+    'uerrno': 'errno',
+}
+
+# Used only when the device has no module of its own
+FALLBACKS = {
+    'wifi_config': 'sim.modules.wifi_config',
+}
+
+# Where device modules are found, like sys.path on the Pico
+DEVICE_PATH = (ROOT, os.path.join(ROOT, 'lib'))
+
+
+class Device:
+    def __init__(self, board):
+        self.board = board
+        board_module.board = board
+        self.modules = dict()
+        self.code = list()
+        self.builtins = dict(builtins.__dict__)
+        self.builtins['open'] = self._open
+        self.builtins['__import__'] = self._import
+
+    # ----- Running -----
+
+    def boot(self, reason, held=(), queued=()):
+        # Runs main.py until the board powers off or resets.
+        # Returns 'sleep' or 'reset'.
+        self.modules = dict()
+        self.code = list()
+        self.board.begin_wake(reason, held, queued)
+        try:
+            self._load('main')
+        except PowerOff:
+            return 'sleep'
+        except Reset:
+            return 'reset'
+        finally:
+            self.board.end_wake()
+        raise RuntimeError('main.py returned')
+
+    def run(self, wakes, buttons=None):
+        # Runs the given number of wakes. buttons maps a wake number to
+        # (held at boot, pressed after the first refresh).
+        buttons = buttons or dict()
+        self.board.max_wakes = wakes
+        self.board.presses = buttons
+        reason = 'power'
+        for wake in range(1, wakes + 1):
+            held, queued = buttons.get(wake, ((), ()))
+            if held and reason != 'reset':
+                reason = 'button'
+            try:
+                result = self.boot(reason, held, queued)
+            except StopSimulation:
+                return
+            except Exception:
+                traceback.print_exc()
+                return
+            if result == 'reset':
+                reason = 'reset'
+                continue
+            alarm = self.board.next_alarm()
+            if alarm is None:
+                print('[sim] Board is off with no alarm set')
+                return
+            self.board.clock.advance(alarm - self.board.clock.time())
+            self.board.alarm = None
+            self.board.timer = None
+            reason = 'rtc'
+
+    # ----- Device builtins -----
+
+    def _open(self, file, mode='r', *args, **kwargs):
+        if isinstance(file, str):
+            file = self.board.path(file)
+        return open(file, mode, *args, **kwargs)
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if name in self.modules:
+            module = self.modules[name]
+        elif name in STAND_INS:
+            with self.board.uncounted():
+                module = importlib.import_module(STAND_INS[name])
+        elif self._find(name):
+            module = self._load(name)
+        elif name in FALLBACKS:
+            module = importlib.import_module(FALLBACKS[name])
+        else:
+            return builtins.__import__(name, globals, locals, fromlist, level)
+
+        if '.' in name and not fromlist:
+            return self._import(name.split('.')[0])
+        return module
+
+    def _find(self, name):
+        filename = name.replace('.', '/') + '.py'
+        for path in DEVICE_PATH:
+            filepath = os.path.join(path, filename)
+            if os.path.isfile(filepath):
+                return filepath
+        return None
+
+    def _load(self, name):
+        filepath = self._find(name)
+        if filepath is None:
+            raise ImportError(f'no module named {name}')
+        module = type(sys)(name)
+        module.__file__ = filepath
+        module.__dict__['__builtins__'] = self.builtins
+        self.modules[name] = module
+        with self.board.uncounted(), open(filepath) as f:
+            # CPython code objects are several times bigger than bytecode
+            code = compile(f.read(), filepath, 'exec')
+            # Kept so that freeing it does not count against the heap
+            self.code.append(code)
+        try:
+            exec(code, module.__dict__)
+        except BaseException:
+            if not isinstance(sys.exc_info()[1], (PowerOff, Reset, StopSimulation)):
+                del self.modules[name]
+            raise
+        return module
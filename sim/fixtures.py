@@ -0,0 +1,120 @@
+import os
+import random
+import struct
+
+"""
+fixtures
+
+Synthetic content for the simulator: JPEG files and the default stub
+internet used when no --fixtures directory is given.
+
+The JPEGs carry valid headers (SOI, APP0, SOF, EOI) around random data.
+That is all the stand-in decoder needs without Pillow.
+"""
+
+# Written into the default fixtures directory. Daily feeds change with the
+# board's date so the apps see new content every day.
+DAILY_IMAGE = '''from sim import board
+from sim.fixtures import synthetic_jpeg
+import time
+
+
+def respond(query):
+    day = time.strftime('%Y-%m-%d', time.gmtime(board.board.clock.time()))
+    return 'image/jpeg', synthetic_jpeg(800, 480, seed='{name}' + day)
+'''
+
+APOD_API = '''from sim import board
+import calendar
+import json
+import time
+
+
+def entry(t):
+    day = time.strftime('%Y-%m-%d', time.gmtime(t))
+    return {
+        'date': day,
+        'title': f'Simulated sky {day}',
+        'explanation': 'A long explanation that the app never shows. ' * 40,
+        'media_type': 'image',
+        'service_version': 'v1',
+        'url': f'https://apod.nasa.gov/apod/image/sim/{day}.jpg',
+        'hdurl': f'https://apod.nasa.gov/apod/image/sim/{day}-hd.jpg',
+    }
+
+
+def respond(query):
+    now = board.board.clock.time()
+    if 'start_date' not in query:
+        return 'application/json', json.dumps(entry(now)).encode()
+    start = calendar.timegm(time.strptime(query['start_date'], '%Y-%m-%d'))
+    end = now
+    if 'end_date' in query:
+        end = calendar.timegm(time.strptime(query['end_date'], '%Y-%m-%d'))
+    entries = []
+    t = start
+    while t <= min(end, now):
+        entries.append(entry(t))
+        t += 86400
+    return 'application/json', json.dumps(entries).encode()
+'''
+
+APOD_IMAGE = '''from sim.fixtures import synthetic_jpeg
+
+
+def respond(query, name):
+    return 'image/jpeg', synthetic_jpeg(1024, 768, seed=name)
+'''
+
+
+def synthetic_jpeg(width, height, seed=None, progressive=False, size=24 * 1024):
+    rng = random.Random(seed)
+    app0 = b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    sof = struct.pack('>BHHB', 8, height, width, 3) + b'\x01\x22\x00\x02\x11\x01\x03\x11\x01'
+    marker = b'\xff\xc2' if progressive else b'\xff\xc0'
+    data = bytearray(b'\xff\xd8')
+    data += b'\xff\xe0' + struct.pack('>H', len(app0) + 2) + app0
+    data += marker + struct.pack('>H', len(sof) + 2) + sof
+    # Scan data, with 0xff bytes stuffed like a real encoder does
+    data += b'\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00'
+    for byte in rng.randbytes(size):
+        data.append(byte)
+        if byte == 0xff:
+            data.append(0)
+    data += b'\xff\xd9'
+    return bytes(data)
+
+
+def make_photos(directory, count, seed=0):
+    # count photos, with the odd oversized, progressive and non-JPEG file
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    for i in range(count):
+        if i % 17 == 5:
+            name, data = f'notes_{i:05}.txt', b'not a photo\n'
+        elif i % 13 == 7:
+            name, data = f'IMG_{i:05}.jpg', synthetic_jpeg(800, 480, seed=i, progressive=True)
+        elif i % 11 == 3:
+            name, data = f'IMG_{i:05}.JPG', synthetic_jpeg(3200, 1920, seed=i)
+        else:
+            width, height = rng.choice(((800, 480), (640, 480), (480, 800)))
+            name, data = f'IMG_{i:05}.jpg', synthetic_jpeg(width, height, seed=i)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+
+
+def make_internet(directory):
+    # The sites the apps use
+    feeds = os.path.join(directory, 'pimoroni.github.io', 'feed2image')
+    apod_api = os.path.join(directory, 'api.nasa.gov', 'planetary')
+    apod_images = os.path.join(directory, 'apod.nasa.gov', 'apod', 'image', 'sim')
+    for path in (feeds, apod_api, apod_images):
+        os.makedirs(path, exist_ok=True)
+    for name in ('nasa-apod-800x480-daily.jpg', 'xkcd-800x480-daily.jpg'):
+        with open(os.path.join(feeds, name + '.py'), 'w') as f:
+            f.write(DAILY_IMAGE.replace('{name}', name))
+    with open(os.path.join(apod_api, 'apod.py'), 'w') as f:
+        f.write(APOD_API)
+    with open(os.path.join(apod_images, '_any.py'), 'w') as f:
+        f.write(APOD_IMAGE)
+    return directory
@@ -0,0 +1,4 @@
+"""
+Stand-ins for the MicroPython and Pimoroni modules, one file per device
+module. See sim.device.STAND_INS for the names device code imports them by.
+"""
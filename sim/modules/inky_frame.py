@@ -0,0 +1,95 @@
+from sim import board as _board
+from sim.modules import machine as _machine
+from sim.modules.pcf85063a import PCF85063A
+
+"""
+inky_frame on the device: the buttons, their LEDs, the wake reason and
+sleep_for().
+"""
+
+SHIFT_STATE = 0
+
+rtc = PCF85063A(None)
+vsys = _machine.Pin(_machine.HOLD_VSYS_EN_PIN, _machine.Pin.OUT)
+
+led_busy = _machine.Pin(6, _machine.Pin.OUT)
+led_wifi = _machine.Pin(7, _machine.Pin.OUT)
+
+
+class Button:
+    def __init__(self, name):
+        self.name = name
+        self.led_state = False
+
+    def read(self):
+        return self.name in _board.board.held
+
+    def led_on(self):
+        self.led_state = True
+
+    def led_off(self):
+        self.led_state = False
+
+    def led_toggle(self):
+        self.led_state = not self.led_state
+
+    def led_brightness(self, brightness):
+        self.led_state = brightness > 0
+
+
+button_a = Button('a')
+button_b = Button('b')
+button_c = Button('c')
+button_d = Button('d')
+button_e = Button('e')
+
+
+def woken_by_rtc():
+    return _board.board.wake_reason == 'rtc'
+
+
+def woken_by_button():
+    return _board.board.wake_reason == 'button'
+
+
+def woken_by_ext_trigger():
+    return False
+
+
+def pcf_to_pico_rtc():
+    # Both run from the board's clock
+    pass
+
+
+def pico_rtc_to_pcf():
+    pass
+
+
+def set_time():
+    # Sets both clocks from NTP, which needs the network
+    from sim.modules import network
+    if not network.connected():
+        raise OSError(-2, 'no network')
+
+
+def turn_off():
+    vsys.init(_machine.Pin.IN)
+
+
+def sleep_for(minutes):
+    # Alarm at the start of the minute, like the real sleep_for()
+    t = int(_board.board.clock.time())
+    if t % 60 >= 55:
+        t += 60
+    minutes = min(minutes, 40320)
+    t = t - t % 60 + minutes * 60
+    import time
+    tm = time.gmtime(t)
+    rtc.clear_alarm_flag()
+    rtc.set_alarm(0, tm.tm_min, tm.tm_hour, tm.tm_mday)
+    rtc.enable_alarm_interrupt(True)
+
+    turn_off()
+
+    # Only reached on USB power
+    _board.board.sleep(t - _board.board.clock.time())
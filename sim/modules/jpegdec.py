@@ -0,0 +1,100 @@
+import hashlib as _hashlib
+import io as _io
+import struct as _struct
+
+from sim import board as _board
+from sim.board import PALETTE as _PALETTE
+
+"""
+jpegdec on the device.
+
+Decodes with Pillow when it is installed, dithered to the palette.
+Without it every image is drawn as a flat block of its size, in a
+colour picked from its contents, so different images still look
+different in the PNGs. Decoding charges virtual time by image area.
+Progressive JPEGs fail like they do on the device.
+"""
+
+JPEG_SCALE_FULL = 0
+JPEG_SCALE_HALF = 2
+JPEG_SCALE_QUARTER = 4
+JPEG_SCALE_EIGHTH = 8
+
+try:
+    from PIL import Image as _Image
+except ImportError:
+    _Image = None
+
+
+def _sof(data):
+    # (width, height, progressive) from the first SOF marker
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xff:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7 or marker == 0xff:
+            i += 1 if marker == 0xff else 2
+            continue
+        length = _struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker in (0xc0, 0xc1, 0xc2):
+            height, width = _struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height, marker == 0xc2
+        i += 2 + length
+    raise OSError(22, 'EINVAL: not a JPEG')
+
+
+class JPEG:
+    def __init__(self, graphics):
+        self._graphics = graphics
+        self._data = None
+
+    def open_file(self, filename):
+        with open(_board.board.path(filename), 'rb') as f:
+            self._data = f.read()
+
+    def open_RAM(self, data):
+        self._data = bytes(data)
+
+    def get_width(self):
+        return _sof(self._data)[0]
+
+    def get_height(self):
+        return _sof(self._data)[1]
+
+    def decode(self, x=0, y=0, scale=JPEG_SCALE_FULL, dither=True):
+        width, height, progressive = _sof(self._data)
+        if progressive:
+            print('[sim] jpegdec: progressive JPEGs are not supported')
+            return 0
+        divisor = max(1, scale)
+        width, height = width // divisor, height // divisor
+        board = _board.board
+        board.sleep(board.costs['jpeg_decode'] * width * height / (800 * 480))
+
+        graphics = self._graphics
+        pen = graphics.get_pen()
+        if _Image is not None:
+            try:
+                self._draw_pillow(x, y, width, height)
+                graphics.set_pen(pen)
+                return 1
+            except OSError:
+                pass
+        graphics.set_pen(2 + _hashlib.sha256(self._data).digest()[0] % 6)
+        graphics.rectangle(x, y, width, height)
+        graphics.set_pen(pen)
+        return 1
+
+    def _draw_pillow(self, x, y, width, height):
+        palette = _Image.new('P', (1, 1))
+        palette.putpalette([c for rgb in _PALETTE for c in rgb] + [0] * 3 * (256 - len(_PALETTE)))
+        image = _Image.open(_io.BytesIO(self._data)).convert('RGB').resize((width, height))
+        image = image.quantize(palette=palette, dither=_Image.Dither.FLOYDSTEINBERG)
+        pixels = image.load()
+        graphics = self._graphics
+        for row in range(height):
+            for col in range(width):
+                graphics.set_pen(pixels[col, row])
+                graphics.pixel(x + col, y + row)
@@ -0,0 +1,178 @@
+from sim import board as _board
+from sim.board import Reset
+
+"""
+machine on the device. Releasing the VSYS hold pin powers the board
+off when it is on battery, like on an Inky Frame.
+"""
+
+HOLD_VSYS_EN_PIN = 2
+
+PWRON_RESET = 1
+WDT_RESET = 3
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 4
+    IRQ_FALLING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self._id = id
+        self._value = 0
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self._value = value
+        if self._id == HOLD_VSYS_EN_PIN and mode == Pin.IN:
+            _board.board.power_off()
+
+    def value(self, value=None):
+        if value is not None:
+            self._value = value
+            return None
+        if self._id == 'WL_GPIO2':
+            return 1 if _board.board.usb else 0
+        return self._value
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value = 1 - self._value
+
+    def high(self):
+        self.on()
+
+    def low(self):
+        self.off()
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        return None
+
+
+class Signal(Pin):
+    pass
+
+
+class SPI:
+    def __init__(self, id, *args, **kwargs):
+        self._id = id
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class I2C(SPI):
+    pass
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self._freq = freq or 1000
+        self._duty = duty_u16 or 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        self._duty = 0
+
+
+class Timer:
+    # Callbacks are not run, the simulator has no interrupts
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, id=-1, **kwargs):
+        pass
+
+    def init(self, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class RTC:
+    def datetime(self, datetime=None):
+        import time
+        clock = _board.board.clock
+        if datetime is not None:
+            year, month, day, weekday, hour, minute, second, _ = datetime
+            import calendar
+            clock.set_time(calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)))
+            return None
+        t = time.gmtime(clock.time())
+        return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        pass
+
+    def feed(self):
+        pass
+
+
+def reset():
+    raise Reset()
+
+
+def soft_reset():
+    raise Reset()
+
+
+def lightsleep(ms=None):
+    _board.board.sleep((ms or 0) / 1000)
+
+
+def deepsleep(ms=None):
+    _board.board.power_off()
+    lightsleep(ms)
+
+
+def idle():
+    pass
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def unique_id():
+    return b'\xe6\x61\x41\x04\x03\x5c\x2a\x2f'
+
+
+def reset_cause():
+    # machine.reset() goes through the watchdog on the RP2040
+    return WDT_RESET if _board.board.wake_reason == 'reset' else PWRON_RESET
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
@@ -0,0 +1,117 @@
+from sim import board as _board
+
+"""
+network on the device. There is one simulated access point, named after
+the first SSID the device connects to. Connecting takes virtual time: a
+scan unless the BSSID is given, the association, then DHCP unless a
+static address was set with ifconfig().
+"""
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+# The access point every SSID connects to
+AP_BSSID = b'\x02\xa0\x0f\x12\x34\x56'
+AP_CHANNEL = 6
+AP_RSSI = -58
+AP_IFCONFIG = ('192.168.1.50', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+NO_IFCONFIG = ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+
+
+def _state(interface):
+    # Per boot, the radio loses its state when the board turns off
+    devices = _board.board.devices
+    key = ('wlan', interface)
+    if key not in devices:
+        devices[key] = {'active': False, 'status': STAT_IDLE, 'ready': None,
+                        'ssid': None, 'static': None, 'config': {'pm': 0, 'channel': 0}}
+    return devices[key]
+
+
+def connected():
+    return WLAN(STA_IF).isconnected()
+
+
+class WLAN:
+    PM_NONE = 0
+    PM_PERFORMANCE = 0xa11142
+    PM_POWERSAVE = 0x111022
+
+    def __init__(self, interface=STA_IF):
+        self._interface = interface
+
+    def active(self, active=None):
+        state = _state(self._interface)
+        if active is None:
+            return state['active']
+        state['active'] = bool(active)
+        if not active:
+            state['status'] = STAT_IDLE
+        _board.board.radio(any(_state(i)['active'] for i in (STA_IF, AP_IF)))
+
+    def connect(self, ssid=None, key=None, *, bssid=None, channel=-1):
+        state = _state(self._interface)
+        if not state['active']:
+            raise OSError(1, 'EPERM: interface not active')
+        costs = _board.board.costs
+        cost = costs['wifi_assoc']
+        if bssid is None:
+            cost += costs['wifi_scan']
+        if state['static'] is None:
+            cost += costs['wifi_dhcp']
+        state['ssid'] = ssid
+        board = _board.board
+        if board.ap_ssid is None:
+            board.ap_ssid = ssid
+        found = (ssid == board.ap_ssid and bssid in (None, AP_BSSID)
+                 and channel in (-1, AP_CHANNEL))
+        state['status'] = STAT_CONNECTING if found else STAT_NO_AP_FOUND
+        state['ready'] = _board.board.clock.monotonic() + cost
+
+    def disconnect(self):
+        _state(self._interface)['status'] = STAT_IDLE
+
+    def status(self, param=None):
+        state = _state(self._interface)
+        if param == 'rssi':
+            return AP_RSSI
+        if state['status'] == STAT_CONNECTING and _board.board.clock.monotonic() >= state['ready']:
+            state['status'] = STAT_GOT_IP
+        return state['status']
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def scan(self):
+        _board.board.sleep(_board.board.costs['wifi_scan'])
+        ssid = _board.board.ap_ssid or 'simulator'
+        return [(ssid.encode(), AP_BSSID, AP_CHANNEL, AP_RSSI, 3, False)]
+
+    def ifconfig(self, config=None):
+        state = _state(self._interface)
+        if config is None:
+            if not self.isconnected():
+                return NO_IFCONFIG
+            return state['static'] or AP_IFCONFIG
+        state['static'] = None if config == 'dhcp' else tuple(config)
+
+    def config(self, *args, **kwargs):
+        state = _state(self._interface)
+        if kwargs:
+            state['config'].update(kwargs)
+            return None
+        param = args[0]
+        if param == 'channel':
+            return AP_CHANNEL if self.isconnected() else state['config']['channel']
+        if param in ('ssid', 'essid'):
+            return state['ssid']
+        if param == 'mac':
+            return b'\x28\xcd\xc1\x00\x00\x01'
+        return state['config'].get(param)
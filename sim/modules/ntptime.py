@@ -0,0 +1,20 @@
+from sim.modules import network as _network
+
+"""
+ntptime on the device. The board's clock is always right, this only
+checks that the network is up.
+"""
+
+host = 'pool.ntp.org'
+timeout = 1
+
+
+def time():
+    if not _network.connected():
+        raise OSError(-2, 'no network')
+    from sim import board as _board
+    return int(_board.board.clock.time())
+
+
+def settime():
+    time()
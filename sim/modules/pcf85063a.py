@@ -0,0 +1,109 @@
+import calendar as _calendar
+import time as _time
+
+from sim import board as _board
+
+"""
+pcf85063a on the device. The chip keeps the board's virtual clock, in
+UTC. The alarm and the countdown timer are turned into an absolute wake
+time on the board. The simulator reads it when the board powers off.
+"""
+
+
+class PCF85063A:
+    TIMER_TICK_4096HZ = 0
+    TIMER_TICK_64HZ = 1
+    TIMER_TICK_1HZ = 2
+    TIMER_TICK_1_OVER_60HZ = 3
+
+    _PERIODS = {0: 1 / 4096, 1: 1 / 64, 2: 1, 3: 60}
+
+    def __init__(self, i2c, address=0x51):
+        self._alarm = None
+        self._alarm_enabled = False
+        self._timer = None
+        self._timer_enabled = False
+
+    def reset(self):
+        self.unset_alarm()
+        self.unset_timer()
+
+    # ----- Time -----
+
+    def datetime(self):
+        t = _time.gmtime(_board.board.clock.time())
+        return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, (t.tm_wday + 1) % 7)
+
+    def set_datetime(self, t):
+        year, month, day, hour, minute, second = t[:6]
+        _board.board.clock.set_time(_calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)))
+
+    # ----- Alarm -----
+
+    def set_alarm(self, second=None, minute=None, hour=None, day=None):
+        self._alarm = (second, minute, hour, day)
+        self._update()
+
+    def set_weekday_alarm(self, second=None, minute=None, hour=None, dotw=None):
+        self.set_alarm(second, minute, hour)
+
+    def enable_alarm_interrupt(self, enable):
+        self._alarm_enabled = enable
+        self._update()
+
+    def read_alarm_flag(self):
+        return _board.board.wake_reason == 'rtc'
+
+    def clear_alarm_flag(self):
+        pass
+
+    def unset_alarm(self):
+        self._alarm = None
+        self._update()
+
+    # ----- Timer -----
+
+    def set_timer(self, ticks, ttp=TIMER_TICK_1HZ):
+        self._timer = _board.board.clock.time() + ticks * self._PERIODS[ttp]
+        self._update()
+
+    def enable_timer_interrupt(self, enable, flag_only=False):
+        self._timer_enabled = enable
+        self._update()
+
+    def read_timer_flag(self):
+        return _board.board.wake_reason == 'rtc'
+
+    def clear_timer_flag(self):
+        pass
+
+    def unset_timer(self):
+        self._timer = None
+        self._update()
+
+    # ----- Board -----
+
+    def _update(self):
+        board = _board.board
+        board.alarm = self._next_alarm() if self._alarm_enabled else None
+        board.timer = self._timer if self._timer_enabled else None
+
+    def _next_alarm(self):
+        # The next time matching every field that is set
+        if self._alarm is None:
+            return None
+        second, minute, hour, day = self._alarm
+        t = int(_board.board.clock.time()) + 1
+        for _ in range(32 * 24 * 3600):
+            tm = _time.gmtime(t)
+            if day is not None and tm.tm_mday != day:
+                t += 86400 - t % 86400
+            elif hour is not None and tm.tm_hour != hour:
+                t += 3600 - t % 3600
+            elif minute is not None and tm.tm_min != minute:
+                t += 60 - t % 60
+            elif second is not None and tm.tm_sec != second:
+                t += 1
+            else:
+                return t
+        return None
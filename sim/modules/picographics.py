@@ -0,0 +1,206 @@
+import colorsys as _colorsys
+import os as _os
+
+from sim import board as _board
+from sim.board import PALETTE as _PALETTE
+from sim.png import write_png as _write_png
+
+"""
+picographics on the device, for the Inky Frame displays.
+
+Pixels are kept as pen numbers, packed 4 bits per pixel. Text is drawn
+as solid blocks, one per character. update() charges the refresh time
+and writes the frame as a PNG into the output directory.
+
+The 7.3" keeps its framebuffer in PSRAM, so by default memoryview(graphics)
+fails like it does on the device. Run with --framebuffer to expose it.
+"""
+
+DISPLAY_INKY_FRAME = 0
+DISPLAY_INKY_FRAME_4 = 1
+DISPLAY_INKY_FRAME_7 = 2
+
+PEN_P4 = 3
+PEN_INKY7 = 7
+
+_BOUNDS = {
+    DISPLAY_INKY_FRAME: (600, 448),
+    DISPLAY_INKY_FRAME_4: (640, 400),
+    DISPLAY_INKY_FRAME_7: (800, 480),
+}
+
+BLACK = 0
+WHITE = 1
+GREEN = 2
+BLUE = 3
+RED = 4
+YELLOW = 5
+ORANGE = 6
+TAUPE = 7
+
+# bitmap8 glyphs: advance width and height in pixels at scale 1
+_GLYPH_WIDTH = 6
+_GLYPH_HEIGHT = 8
+
+
+def _nearest(r, g, b):
+    best, pen = None, 0
+    for i, (pr, pg, pb) in enumerate(_PALETTE):
+        d = (pr - r) ** 2 + (pg - g) ** 2 + (pb - b) ** 2
+        if best is None or d < best:
+            best, pen = d, i
+    return pen
+
+
+class _Graphics:
+    def __init__(self, display):
+        self.width, self.height = _BOUNDS[display]
+        self._pen = 0
+        self._font = 'bitmap8'
+        self._clip = (0, 0, self.width, self.height)
+
+    def _init_buffer(self, buffer):
+        self._buf = buffer
+        self._stride = (self.width + 1) // 2
+
+    # ----- Setup -----
+
+    def get_bounds(self):
+        return self.width, self.height
+
+    def set_font(self, font):
+        self._font = font
+
+    def set_thickness(self, thickness):
+        pass
+
+    def set_update_speed(self, speed):
+        pass
+
+    def set_clip(self, x, y, w, h):
+        self._clip = (max(0, x), max(0, y), min(self.width, x + w), min(self.height, y + h))
+
+    def remove_clip(self):
+        self._clip = (0, 0, self.width, self.height)
+
+    # ----- Pens -----
+
+    def create_pen(self, r, g, b):
+        return _nearest(r, g, b)
+
+    def create_pen_hsv(self, h, s, v):
+        r, g, b = _colorsys.hsv_to_rgb(h % 1.0, s, v)
+        return _nearest(int(r * 255), int(g * 255), int(b * 255))
+
+    def set_pen(self, pen):
+        self._pen = int(pen) & 0x7
+
+    def get_pen(self):
+        return self._pen
+
+    # ----- Drawing -----
+
+    def _span(self, x, y, length):
+        x1, y1, x2, y2 = self._clip
+        if y < y1 or y >= y2:
+            return
+        start, end = max(x, x1), min(x + length, x2)
+        if start >= end:
+            return
+        buf, pen, row = self._buf, self._pen, y * self._stride
+        if start & 1:
+            i = row + start // 2
+            buf[i] = (buf[i] & 0xf0) | pen
+            start += 1
+        if end & 1 and start < end:
+            i = row + end // 2
+            buf[i] = (buf[i] & 0x0f) | (pen << 4)
+            end -= 1
+        if start < end:
+            buf[row + start // 2:row + end // 2] = bytes((pen << 4 | pen,)) * ((end - start) // 2)
+
+    def clear(self):
+        self.rectangle(0, 0, self.width, self.height)
+
+    def pixel(self, x, y):
+        self._span(x, y, 1)
+
+    def pixel_span(self, x, y, length):
+        self._span(x, y, length)
+
+    def rectangle(self, x, y, w, h):
+        for row in range(max(y, 0), min(y + h, self.height)):
+            self._span(x, row, w)
+
+    def line(self, x1, y1, x2, y2, thickness=1):
+        if x1 == x2:
+            for y in range(min(y1, y2), max(y1, y2) + 1):
+                self._span(x1, y, thickness)
+            return
+        steps = max(abs(x2 - x1), abs(y2 - y1))
+        for i in range(steps + 1):
+            self._span(x1 + (x2 - x1) * i // steps, y1 + (y2 - y1) * i // steps, thickness)
+
+    def circle(self, x, y, r):
+        for dy in range(-r, r + 1):
+            dx = int((r * r - dy * dy) ** 0.5)
+            self._span(x - dx, y + dy, 2 * dx + 1)
+
+    def triangle(self, x1, y1, x2, y2, x3, y3):
+        self.polygon([(x1, y1), (x2, y2), (x3, y3)])
+
+    def polygon(self, points):
+        for (xa, ya), (xb, yb) in zip(points, points[1:] + points[:1]):
+            self.line(xa, ya, xb, yb)
+
+    def measure_text(self, text, scale=2, spacing=1, fixed_width=False):
+        return int(len(str(text)) * (_GLYPH_WIDTH + spacing - 1) * scale)
+
+    def text(self, text, x, y, wordwrap=None, scale=2, angle=0, spacing=1, fixed_width=False):
+        text = str(text)
+        advance = int((_GLYPH_WIDTH + spacing - 1) * scale)
+        width = int((_GLYPH_WIDTH - 1) * scale)
+        height = int((_GLYPH_HEIGHT - 1) * scale)
+        cx = x
+        for char in text:
+            if wordwrap and cx + advance > x + wordwrap:
+                cx = x
+                y += int(_GLYPH_HEIGHT * scale)
+            if not char.isspace():
+                self.rectangle(cx, y, width, height)
+            cx += advance
+
+    # ----- Display -----
+
+    def update(self):
+        board = _board.board
+        board.refreshes += 1
+        board.release_buttons()
+        board.sleep(board.costs['refresh'])
+        if board.out:
+            filename = _os.path.join(board.out, f'frame_{board.refreshes:04}.png')
+            _write_png(filename, self.width, self.height, self._buf, _PALETTE)
+            board.frames.append(filename)
+            print(f'[sim] Display refreshed: {filename}')
+
+
+class _PSRAMGraphics(_Graphics):
+    # No buffer protocol, like the 7.3"
+    def __init__(self, display):
+        _Graphics.__init__(self, display)
+        with _board.board.uncounted():
+            self._init_buffer(bytearray(((self.width + 1) // 2) * self.height))
+
+
+class _FramebufferGraphics(_Graphics, bytearray):
+    # memoryview(graphics) is the packed framebuffer
+    def __init__(self, display):
+        _Graphics.__init__(self, display)
+        bytearray.__init__(self, ((self.width + 1) // 2) * self.height)
+        self._init_buffer(self)
+
+
+def PicoGraphics(display, pen_type=None, **kwargs):
+    if _board.board.framebuffer:
+        return _FramebufferGraphics(display)
+    return _PSRAMGraphics(display)
@@ -0,0 +1,8 @@
+"""
+pimoroni_i2c on the device.
+"""
+
+
+class PimoroniI2C:
+    def __init__(self, sda, scl, baudrate=400000):
+        pass
@@ -0,0 +1,16 @@
+"""
+rp2 on the device.
+"""
+
+_country = None
+
+
+def country(code=None):
+    global _country
+    if code is None:
+        return _country
+    _country = code
+
+
+def bootsel_button():
+    return 0
@@ -0,0 +1,18 @@
+"""
+sdcard on the device. The card is the board's SD directory, mounted by
+os.mount(sd, '/sd').
+"""
+
+
+class SDCard:
+    def __init__(self, spi, cs, baudrate=1320000):
+        pass
+
+    def readblocks(self, block, buf, offset=0):
+        raise OSError(5, 'EIO: use the filesystem')
+
+    def writeblocks(self, block, buf, offset=0):
+        raise OSError(5, 'EIO: use the filesystem')
+
+    def ioctl(self, op, arg):
+        return 0
@@ -0,0 +1,47 @@
+import asyncio as _asyncio
+
+from sim import board as _board
+
+"""
+uasyncio on the device, on top of asyncio. Sleeps move the virtual clock.
+"""
+
+TimeoutError = _asyncio.TimeoutError
+CancelledError = _asyncio.CancelledError
+Event = _asyncio.Event
+Lock = _asyncio.Lock
+create_task = _asyncio.ensure_future
+gather = _asyncio.gather
+run = _asyncio.run
+
+_loop = None
+
+
+def get_event_loop():
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = _asyncio.new_event_loop()
+    return _loop
+
+
+async def sleep(seconds):
+    _board.board.sleep(seconds)
+    await _asyncio.sleep(0)
+
+
+async def sleep_ms(ms):
+    await sleep(ms / 1000)
+
+
+async def wait_for(coro, timeout):
+    # Timeouts are in virtual time
+    clock = _board.board.clock
+    deadline = clock.monotonic() + timeout
+    task = _asyncio.ensure_future(coro)
+    while not task.done():
+        if clock.monotonic() >= deadline:
+            task.cancel()
+            raise TimeoutError()
+        await _asyncio.sleep(0)
+    return task.result()
+
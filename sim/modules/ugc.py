@@ -0,0 +1,43 @@
+import gc as _gc
+import tracemalloc as _tracemalloc
+
+from sim import board as _board
+
+"""
+gc on the device. Memory figures come from tracemalloc when it is
+running (python -m sim --memory), counted from the start of the boot
+against the Pico W's free heap. CPython objects are bigger than
+MicroPython's, so compare them with each other rather than the device.
+"""
+
+HEAP = 166 * 1024
+
+
+def collect():
+    _gc.collect()
+
+
+def enable():
+    pass
+
+
+def disable():
+    pass
+
+
+def isenabled():
+    return True
+
+
+def threshold(amount=None):
+    return -1
+
+
+def mem_alloc():
+    if _tracemalloc.is_tracing():
+        return max(0, _tracemalloc.get_traced_memory()[0] - _board.board.memory_base)
+    return 0
+
+
+def mem_free():
+    return max(0, HEAP - mem_alloc())
@@ -0,0 +1,94 @@
+import os as _os
+
+from sim import board as _board
+
+"""
+os on the device, backed by host directories. See Board.path().
+"""
+
+sep = '/'
+
+
+def _path(path):
+    return _board.board.path(path)
+
+
+def _stat(path):
+    st = _os.stat(_path(path))
+    mode = 0x4000 if _os.path.isdir(_path(path)) else 0x8000
+    mtime = int(st.st_mtime)
+    return (mode, 0, 0, 0, 0, 0, st.st_size, mtime, mtime, mtime)
+
+
+def _entries(path):
+    # Host names plus the SD card mount point
+    names = sorted(_os.listdir(_path(path)))
+    if path.strip('/') == '' and _board.board.sd_mounted and 'sd' not in names:
+        names.append('sd')
+    return names
+
+
+def listdir(path='/'):
+    return _entries(path)
+
+
+def ilistdir(path='/'):
+    for name in _entries(path):
+        st = _stat(f'{path.rstrip("/")}/{name}')
+        yield (name, st[0], 0, st[6] if st[0] == 0x8000 else -1)
+
+
+def stat(path):
+    return _stat(path)
+
+
+def statvfs(path):
+    st = _os.statvfs(_path(path))
+    return (st.f_bsize, st.f_frsize, st.f_blocks, st.f_bfree, st.f_bavail, 0, 0, 0, 0, st.f_namemax)
+
+
+def mkdir(path):
+    _os.mkdir(_path(path))
+
+
+def rmdir(path):
+    _os.rmdir(_path(path))
+
+
+def remove(path):
+    if _os.path.isdir(_path(path)):
+        raise OSError(21, 'EISDIR')
+    _os.remove(_path(path))
+
+
+def rename(old, new):
+    _os.replace(_path(old), _path(new))
+
+
+def getcwd():
+    return '/'
+
+
+def chdir(path):
+    if path not in ('/', ''):
+        raise OSError(1, 'EPERM: the simulator only runs from /')
+
+
+def mount(device, path):
+    if path.rstrip('/') != '/sd':
+        raise OSError(22, 'EINVAL')
+    if _board.board.sd_mounted:
+        raise OSError(1, 'EPERM')
+    _board.board.sd_mounted = True
+
+
+def umount(path):
+    _board.board.sd_mounted = False
+
+
+def uname():
+    return ('rp2', 'rp2', 'sim', 'sim', 'Raspberry Pi Pico W with RP2040 (simulated)')
+
+
+def sync():
+    pass
@@ -0,0 +1 @@
+from sim.modules.urllib import urequest
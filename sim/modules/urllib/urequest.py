@@ -0,0 +1,47 @@
+import http.client as _http
+from urllib.parse import urlsplit as _urlsplit
+
+from sim import board as _board
+from sim.modules import network as _network
+
+"""
+urllib.urequest on the device. Requests go to the stub server started
+by the simulator, which answers from the fixtures directory.
+"""
+
+
+class _Response:
+    def __init__(self, connection, response):
+        self._connection = connection
+        self._response = response
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._response.read()
+        return self._response.read(size)
+
+    def readinto(self, buf):
+        return self._response.readinto(buf)
+
+    def readline(self):
+        return self._response.readline()
+
+    def close(self):
+        self._response.close()
+        self._connection.close()
+
+
+def urlopen(url, data=None, method='GET'):
+    if not _network.connected():
+        raise OSError(-2, 'network is down')
+    board = _board.board
+    if board.network_url is None:
+        raise OSError(-2, 'no stub server')
+    parts = _urlsplit(url)
+    stub = _urlsplit(board.network_url)
+    path = f'/{parts.hostname}{parts.path}'
+    if parts.query:
+        path += '?' + parts.query
+    connection = _http.HTTPConnection(stub.hostname, stub.port, timeout=10)
+    connection.request(method, path, body=data)
+    return _Response(connection, connection.getresponse())
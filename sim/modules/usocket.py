@@ -0,0 +1,67 @@
+import socket as _socket
+from urllib.parse import urlsplit as _urlsplit
+
+from sim import board as _board
+from sim.modules import network as _network
+
+"""
+usocket on the device. Every host resolves to the stub server started
+by the simulator, which tells the sites apart by the Host header.
+Only the client side used by the apps is here.
+"""
+
+AF_INET = 2
+SOCK_STREAM = 1
+IPPROTO_TCP = 6
+SOL_SOCKET = 1
+SO_REUSEADDR = 4
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    if not _network.connected():
+        raise OSError(-2, 'network is down')
+    board = _board.board
+    if board.network_url is None:
+        raise OSError(-2, 'no stub server')
+    stub = _urlsplit(board.network_url)
+    return [(AF_INET, SOCK_STREAM, IPPROTO_TCP, '', (stub.hostname, stub.port))]
+
+
+class socket:
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=IPPROTO_TCP):
+        self._socket = _socket.socket(_socket.AF_INET, _socket.SOCK_STREAM)
+        self._file = None
+
+    def settimeout(self, timeout):
+        self._socket.settimeout(timeout)
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def connect(self, address):
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rb')
+
+    def write(self, data):
+        self._socket.sendall(data)
+        return len(data)
+
+    send = write
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buf, size=None):
+        view = memoryview(buf)
+        if size is not None:
+            view = view[:size]
+        # Like the device, returns what has arrived so far, which may be short
+        return self._file.readinto1(view)
+
+    def readline(self):
+        return self._file.readline()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._socket.close()
@@ -0,0 +1,13 @@
+"""
+ussl on the device. The stub server speaks plain HTTP, so wrapping a
+socket leaves it as it is.
+"""
+
+CERT_NONE = 0
+CERT_OPTIONAL = 1
+CERT_REQUIRED = 2
+
+
+def wrap_socket(sock, server_side=False, key=None, cert=None, cert_reqs=CERT_NONE,
+                cadata=None, server_hostname=None, do_handshake=True):
+    return sock
@@ -0,0 +1,70 @@
+import time as _time
+
+from sim import board as _board
+
+"""
+time on the device, on the board's virtual clock. Sleeps return at once
+and move the clock forward.
+"""
+
+_TICKS_PERIOD = 1 << 30
+
+
+def _clock():
+    return _board.board.clock
+
+
+def time():
+    return int(_clock().time())
+
+
+def time_ns():
+    return int(_clock().time() * 1e9)
+
+
+def localtime(secs=None):
+    t = _time.gmtime(time() if secs is None else secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+gmtime = localtime
+
+
+def mktime(t):
+    import calendar
+    return calendar.timegm((t[0], t[1], t[2], t[3], t[4], t[5], 0, 0, 0))
+
+
+def sleep(seconds):
+    _board.board.sleep(seconds)
+
+
+def sleep_ms(ms):
+    _board.board.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    _board.board.sleep(us / 1000000)
+
+
+def ticks_ms():
+    return int(_clock().monotonic() * 1000) % _TICKS_PERIOD
+
+
+def ticks_us():
+    return int(_clock().monotonic() * 1000000) % _TICKS_PERIOD
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(end, start):
+    diff = (end - start) % _TICKS_PERIOD
+    if diff >= _TICKS_PERIOD // 2:
+        diff -= _TICKS_PERIOD
+    return diff
@@ -0,0 +1,6 @@
+"""
+wifi_config for the simulator, used when the device has none.
+"""
+
+WIFI_SSID = 'simulator'
+WIFI_PASSWORD = 'simulator'
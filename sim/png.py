@@ -0,0 +1,28 @@
+import struct
+import zlib
+
+"""
+png
+
+Writes the packed 4 bits per pixel framebuffer as a palette PNG, which
+uses the same layout: two pixels per byte, high nibble first.
+"""
+
+
+def _chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+def write_png(filename, width, height, pixels, palette):
+    stride = (width + 1) // 2
+    raw = bytearray()
+    for y in range(height):
+        raw.append(0)
+        raw += pixels[y * stride:(y + 1) * stride]
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 4, 3, 0, 0, 0)))
+        f.write(_chunk(b'PLTE', b''.join(bytes(rgb) for rgb in palette)))
+        f.write(_chunk(b'IDAT', zlib.compress(bytes(raw), 6)))
+        f.write(_chunk(b'IEND', b''))
@@ -0,0 +1,81 @@
+import importlib.util
+import mimetypes
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+"""
+stub server
+
+A local HTTP server standing in for the internet. A request for
+https://host/path is answered from <fixtures>/host/path. urequest puts
+the host in the path, the usocket stand-in sends it as the Host header. If there is a
+<fixtures>/host/path.py instead, its respond(query) is called and
+returns (content type, body), so answers can depend on the query and on
+the board's date. A _any.py answers every other name in its directory
+with respond(query, name).
+"""
+
+
+def _fixture(filename):
+    spec = importlib.util.spec_from_file_location('fixture', filename)
+    fixture = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fixture)
+    return fixture
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path
+        host = self.headers.get('Host')
+        if host and host != '%s:%d' % self.server.server_address:
+            path = f'/{host}{path}'
+        filepath = os.path.normpath(os.path.join(self.server.fixtures, path.lstrip('/')))
+        if not filepath.startswith(self.server.fixtures):
+            self.send_error(403)
+            return
+
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        any_path = os.path.join(os.path.dirname(filepath), '_any.py')
+        if os.path.isfile(filepath):
+            content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
+            with open(filepath, 'rb') as f:
+                body = f.read()
+        elif os.path.isfile(filepath + '.py'):
+            content_type, body = _fixture(filepath + '.py').respond(query)
+        elif os.path.isfile(any_path):
+            content_type, body = _fixture(any_path).respond(query, os.path.basename(filepath))
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    def __init__(self, fixtures):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.fixtures = os.path.abspath(fixtures)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
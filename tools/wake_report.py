@@ -0,0 +1,117 @@
+import argparse
+import struct
+import sys
+
+"""
+wake report
+
+Summarises the wake profile written by inky_helper.profile_flush().
+Copy wake_profile.bin off the SD card and run on a computer:
+
+python tools/wake_report.py wake_profile.bin
+
+For every app and phase it prints the number of samples, the p50 and p95
+duration and the peak memory in use at the end of the phase.
+"""
+
+# Must match inky_helper.py
+PROFILE_MAGIC = b'IFWP'
+PROFILE_HEADER = '<4sHHI'
+PROFILE_RECORD = '<I16s12sIII'
+
+
+def read_profile(filename):
+    # Returns a list of (wake, app, phase, duration_us, mem_free, mem_alloc)
+    header_size = struct.calcsize(PROFILE_HEADER)
+    record_size = struct.calcsize(PROFILE_RECORD)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    magic, slots, head, count = struct.unpack_from(PROFILE_HEADER, data)
+    if magic != PROFILE_MAGIC:
+        raise ValueError(f'{filename} is not a wake profile')
+
+    records = []
+    used = min(slots, (len(data) - header_size) // record_size)
+    for slot in range(used):
+        wake, app, phase, duration, mem_free, mem_alloc = struct.unpack_from(
+            PROFILE_RECORD, data, header_size + slot * record_size)
+        app = app.rstrip(b'\0').decode()
+        phase = phase.rstrip(b'\0').decode()
+        records.append((wake, app, phase, duration, mem_free, mem_alloc))
+    return records
+
+
+def percentile(values, p):
+    # Nearest-rank percentile
+    values = sorted(values)
+    rank = max(1, -(-len(values) * p // 100))
+    return values[rank - 1]
+
+
+def summarise(records):
+    # Phases that run more than once in a wake are added together, so every
+    # sample is the cost of a phase for one wake.
+    # {(app, phase): {wake: [duration_us, peak_alloc, min_free]}}
+    phases = dict()
+    order = list()
+    for wake, app, phase, duration, mem_free, mem_alloc in records:
+        key = (app, phase)
+        if key not in phases:
+            phases[key] = dict()
+            order.append(key)
+        sample = phases[key].setdefault(wake, [0, 0, mem_free])
+        sample[0] += duration
+        sample[1] = max(sample[1], mem_alloc)
+        sample[2] = min(sample[2], mem_free)
+
+    # Whole wake per app
+    wakes = dict()
+    for wake, app, phase, duration, mem_free, mem_alloc in records:
+        sample = wakes.setdefault(app, dict()).setdefault(wake, [0, 0, mem_free])
+        sample[0] += duration
+        sample[1] = max(sample[1], mem_alloc)
+        sample[2] = min(sample[2], mem_free)
+    for app in wakes:
+        phases[(app, '(wake)')] = wakes[app]
+        order.append((app, '(wake)'))
+
+    rows = []
+    for app, phase in sorted(order, key=lambda k: (k[0], k[1] == '(wake)')):
+        samples = list(phases[(app, phase)].values())
+        durations = [s[0] for s in samples]
+        rows.append((app, phase, len(samples),
+                     percentile(durations, 50) / 1000,
+                     percentile(durations, 95) / 1000,
+                     max(s[1] for s in samples) / 1024,
+                     min(s[2] for s in samples) / 1024))
+    return rows
+
+
+def print_report(rows, out=sys.stdout):
+    print(f'{"app":<14}{"phase":<14}{"n":>6}{"p50 ms":>11}{"p95 ms":>11}{"peak KB":>10}{"min free KB":>13}', file=out)
+    app = None
+    for row in rows:
+        if app is not None and row[0] != app:
+            print(file=out)
+        app = row[0]
+        print('{:<14}{:<14}{:>6}{:>11.1f}{:>11.1f}{:>10.1f}{:>13.1f}'.format(*row), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarise an Inky Frame wake profile.')
+    parser.add_argument('profile', help='wake_profile.bin copied from the SD card')
+    parser.add_argument('--app', help='only report this app')
+    args = parser.parse_args(argv)
+
+    records = read_profile(args.profile)
+    if args.app:
+        records = [r for r in records if r[1] == args.app]
+    if not records:
+        print('No samples')
+        return 1
+    print_report(summarise(records))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())